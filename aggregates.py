@@ -0,0 +1,160 @@
+# Agrégats matérialisés (chiffre d'affaires et quantités), mis à jour par différence à chaque changement
+# d'une partition de commandes ou de l'archive
+import threading
+
+import numpy as np
+import pandas as pd
+
+from archive import block_sources
+from enrichment import ENRICHER
+from storage import list_partitions, partition_sources
+from transforms import CUSTOMERS, DISHES, extract_delivery_dates, intern_orders
+
+ORDER_FILES = ["commandes", "commandes_additionnelles"]
+AGGREGATE_KEYS = {
+    "jour_plat": ["jour", "plat_code"],
+    "source": ["source_name"],
+    "client": ["client_code"],
+}
+VALUES = ["quantity", "revenue", "lines"]
+
+
+# === Contribution d'une source ===
+def _hot_lines(df, catalog):
+    # Partition non archivée : prix manquants complétés par le catalogue, date déduite du titre
+    if df.empty:
+        return df
+    lines = ENRICHER.enrich(df, None, catalog, columns=["Plat", "plat_code", "client_code", "quantity", "price", "source_name"])
+    lines["date_livraison"] = extract_delivery_dates(lines["Plat"])
+    return lines
+
+
+def _contribution(lines):
+    if lines.empty:
+        return None
+    lines = intern_orders(lines)
+    quantity = pd.to_numeric(lines["quantity"], errors="coerce").fillna(0).to_numpy("float64")
+    price = pd.to_numeric(lines["price"], errors="coerce").to_numpy("float64") if "price" in lines.columns else np.nan
+    # Jour en entier (NaT -> plus petit int64) : les index s'alignent sans cas particulier pour les dates manquantes
+    frame = pd.DataFrame({
+        "jour": pd.to_datetime(lines["date_livraison"]).to_numpy("datetime64[D]").astype("int64"),
+        "plat_code": lines["plat_code"].to_numpy(),
+        "source_name": lines["source_name"].fillna("").astype(str).to_numpy() if "source_name" in lines.columns else "",
+        "client_code": lines["client_code"].to_numpy(),
+        "quantity": quantity,
+        "revenue": np.nan_to_num(price * quantity),
+        "lines": 1,
+    })
+    return {name: frame.groupby(keys)[VALUES].sum() for name, keys in AGGREGATE_KEYS.items()}
+
+
+def order_sources(versions, catalog):
+    # Toutes les partitions (le jeton inclut la version du catalogue, qui fixe les prix manquants)
+    # + tous les blocs de l'archive : l'historique complet, relu seulement là où il a changé
+    sources = {}
+    for name in ORDER_FILES:
+        for path, (token, loader) in partition_sources(name, versions, weeks=list_partitions(name)).items():
+            sources[path] = ((token, catalog[0]), lambda loader=loader: _hot_lines(loader(), catalog))
+        sources.update(block_sources(name))
+    return sources
+
+
+# === Tables agrégées ===
+class MaterializedAggregates:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tokens = {}      # source -> jeton de version
+        self._contrib = {}     # source -> {agrégat: DataFrame}
+        self._totals = {name: None for name in AGGREGATE_KEYS}
+        self._views = {}
+        self.version = 0
+
+    def refresh(self, sources):
+        # sources : {identifiant: (jeton, chargeur)} ; seules les sources dont le jeton a changé sont relues
+        with self._lock:
+            deltas = []
+            for source in [s for s in self._tokens if s not in sources]:
+                deltas.append((self._contrib.pop(source, None), -1))
+                del self._tokens[source]
+            for source, (token, loader) in sources.items():
+                if self._tokens.get(source) == token:
+                    continue
+                new = _contribution(loader())
+                deltas += [(self._contrib.pop(source, None), -1), (new, 1)]
+                if new is not None:
+                    self._contrib[source] = new
+                self._tokens[source] = token
+            if deltas:
+                self._apply(deltas)
+                self.version += 1
+                self._views.clear()
+            return len(deltas)
+
+    def _apply(self, deltas):
+        # Toutes les différences d'un rafraîchissement combinées en un seul regroupement par agrégat
+        for name, keys in AGGREGATE_KEYS.items():
+            parts = [contrib[name] * sign for contrib, sign in deltas if contrib is not None]
+            if not parts:
+                continue
+            if self._totals[name] is not None:
+                parts.insert(0, self._totals[name])
+            total = pd.concat(parts).groupby(level=keys).sum()
+            self._totals[name] = total[total["lines"] != 0]
+
+    def _cached(self, key, build):
+        with self._lock:
+            if key not in self._views:
+                self._views[key] = build()
+            return self._views[key]
+
+    def _frame(self, name):
+        total = self._totals[name]
+        if total is None:
+            return pd.DataFrame(columns=AGGREGATE_KEYS[name] + VALUES).set_index(AGGREGATE_KEYS[name])
+        return total
+
+    def by_day_dish(self):
+        def build():
+            df = self._frame("jour_plat").reset_index()
+            return pd.DataFrame({
+                "date_livraison": df["jour"].to_numpy("int64").astype("datetime64[D]"),
+                "Plat": DISHES.decode(df["plat_code"].to_numpy()),
+                "plat_code": df["plat_code"].to_numpy("int32"),
+                "quantity": df["quantity"].to_numpy("float64"),
+                "revenue": df["revenue"].to_numpy("float64"),
+            }).sort_values(["date_livraison", "revenue"], ascending=[True, False], ignore_index=True)
+        return self._cached("jour_plat", build)
+
+    def by_source(self):
+        def build():
+            df = self._frame("source")[["quantity", "revenue"]].reset_index()
+            return df.sort_values("revenue", ascending=False, ignore_index=True)
+        return self._cached("source", build)
+
+    def by_customer(self):
+        def build():
+            df = self._frame("client").reset_index()
+            return pd.DataFrame({
+                "client_code": df["client_code"].to_numpy("int64"),
+                "Nom": CUSTOMERS.decode(df["client_code"].to_numpy()),
+                "quantity": df["quantity"].to_numpy("float64"),
+                "revenue": df["revenue"].to_numpy("float64"),
+            }).sort_values("revenue", ascending=False, ignore_index=True)
+        return self._cached("client", build)
+
+    def by_route(self, customers):
+        # Itinéraire lu dans la fiche client actuelle : dérivé de l'agrégat par client, sans relire les commandes
+        def build():
+            table = ENRICHER.customers(customers)
+            by_customer = self.by_customer()
+            route = (table.take(table.positions(by_customer["client_code"]), "Itinéraire")
+                     if "Itinéraire" in table.columns else np.full(len(by_customer), np.nan, dtype=object))
+            route = (pd.Series(route, dtype=object).astype(str).str.replace(r"\.0$", "", regex=True)
+                     .mask(pd.isna(route), "Sans itinéraire"))
+            return (by_customer.groupby(route.to_numpy())[["quantity", "revenue"]].sum()
+                    .rename_axis("Itinéraire").reset_index()
+                    .sort_values("revenue", ascending=False, ignore_index=True))
+        return self._cached(("itineraire", customers[0]), build)
+
+
+ORDER_AGGREGATES = MaterializedAggregates()
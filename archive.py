@@ -0,0 +1,235 @@
+# Archive froide des commandes : blocs compressés par colonne + zone maps
+import json
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from storage import (ARCHIVE_DIR, NO_DATE_PARTITION, FileLock, current_week_key, file_stamp, flush_writes,
+                     list_partitions, partition_path)
+from transforms import extract_delivery_dates
+
+BLOCK_ROWS = 4096
+TEXT_COLUMNS = ["Plat", "Nom", "source_name", "note"]
+NUMERIC_COLUMNS = ["order_number", "quantity", "price"]
+ARCHIVE_COLUMNS = ["order_number", "date_livraison", "Plat", "Nom", "quantity", "price", "source_name", "note"]
+
+
+def _archive_dir(name):
+    return os.path.join(ARCHIVE_DIR, name)
+
+
+def _index_path(name):
+    return os.path.join(_archive_dir(name), "index.json")
+
+
+def _read_state(name):
+    # index.json : {"blocks": zone maps des blocs, "compacted": semaine -> (mtime_ns, taille) de la partition archivée}
+    path = _index_path(name)
+    if not os.path.exists(path):
+        return {"blocks": [], "compacted": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_index(name):
+    return _read_state(name)["blocks"]
+
+
+def _write_index(name, index):
+    path = _index_path(name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# === Écriture ===
+def _normalize(df):
+    out = pd.DataFrame(index=df.index)
+    for col in ARCHIVE_COLUMNS:
+        if col in df.columns:
+            out[col] = df[col]
+        else:
+            out[col] = np.nan
+    for col in NUMERIC_COLUMNS:
+        out[col] = pd.to_numeric(out[col], errors="coerce").astype("float64")
+    for col in TEXT_COLUMNS:
+        out[col] = out[col].fillna("").astype(str)
+    out["date_livraison"] = pd.to_datetime(out["date_livraison"])
+    return out.sort_values(["date_livraison", "order_number"], kind="stable").reset_index(drop=True)
+
+
+def _zone(series):
+    series = series.dropna()
+    if series.empty:
+        return None
+    low, high = series.min(), series.max()
+    if isinstance(low, pd.Timestamp):
+        return [low.date().isoformat(), high.date().isoformat()]
+    return [float(low), float(high)]
+
+
+def _write_block(name, block_id, df, compress):
+    arrays = {}
+    for col in NUMERIC_COLUMNS:
+        arrays[col] = df[col].to_numpy("float64")
+    arrays["date_livraison"] = df["date_livraison"].to_numpy("datetime64[D]")
+    for col in TEXT_COLUMNS:
+        # Encodage dictionnaire : codes int32 + valeurs distinctes du bloc
+        codes, uniques = pd.factorize(df[col])
+        arrays[f"{col}.codes"] = codes.astype("int32")
+        arrays[f"{col}.dict"] = np.asarray(uniques, dtype=str)
+    filename = f"bloc_{block_id:05d}.npz"
+    save = np.savez_compressed if compress else np.savez
+    save(os.path.join(_archive_dir(name), filename), **arrays)
+    return {
+        "file": filename,
+        "rows": len(df),
+        "date_livraison": _zone(df["date_livraison"]),
+        "order_number": _zone(df["order_number"]),
+        "price": _zone(df["price"]),
+        "plats": sorted(set(df["Plat"])),
+    }
+
+
+def append_to_archive(df, name, compress=True, block_rows=BLOCK_ROWS, compacted=None):
+    # compacted : partitions d'où viennent les lignes, enregistrées dans la même écriture de l'index que les blocs
+    if df.empty:
+        return 0
+    os.makedirs(_archive_dir(name), exist_ok=True)
+    df = _normalize(df)
+    with FileLock(_index_path(name)):
+        state = _read_state(name)
+        index = state["blocks"]
+        next_id = max((int(b["file"][5:10]) for b in index), default=-1) + 1
+        for start in range(0, len(df), block_rows):
+            index.append(_write_block(name, next_id, df.iloc[start:start + block_rows], compress))
+            next_id += 1
+        # Partitions supprimées depuis leur compaction : plus rien à reconnaître
+        state["compacted"] = {key: stamp for key, stamp in state["compacted"].items()
+                              if os.path.exists(partition_path(name, key))}
+        state["compacted"].update(compacted or {})
+        _write_index(name, state)
+    return len(df)
+
+
+# === Compaction depuis le stockage hebdomadaire ===
+def _past_partitions(name):
+    current = current_week_key()
+    return [k for k in list_partitions(name) if k != NO_DATE_PARTITION and k < current]
+
+
+def compact_orders(name, prices=None, compress=True):
+    # Déplace les semaines passées dans l'archive (rien à faire la plupart du temps)
+    if not _past_partitions(name):
+        return 0
+    os.makedirs(_archive_dir(name), exist_ok=True)
+    try:
+        # Un seul processus compacte à la fois ; les autres n'attendent pas, la compaction est déjà en cours
+        with FileLock(_archive_dir(name), timeout=0):
+            return _compact_locked(name, prices, compress)
+    except TimeoutError:
+        return 0
+
+
+def _compact_locked(name, prices, compress):
+    # Liste relue sous le verrou : une partition déjà archivée par un autre processus n'est pas reprise
+    past = _past_partitions(name)
+    if not past:
+        return 0
+    flush_writes()
+    compacted = _read_state(name)["compacted"]
+    frames, done, stamps = [], [], {}
+    for key in past:
+        path = partition_path(name, key)
+        stamp = file_stamp(path)
+        if stamp is None:
+            continue
+        if compacted.get(key) == list(stamp):
+            # Déjà archivée (arrêt entre l'écriture des blocs et la suppression) : seulement la suppression
+            done.append(path)
+            continue
+        try:
+            df = pd.read_csv(path)
+        except FileNotFoundError:
+            continue
+        year, week = key.split("-W")
+        # Année de livraison déduite de la semaine de la partition
+        df["date_livraison"] = extract_delivery_dates(df["Plat"], reference=date.fromisocalendar(int(year), int(week), 1))
+        frames.append(df)
+        done.append(path)
+        stamps[key] = list(stamp)
+    frames = [df for df in frames if not df.empty]
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        if prices:
+            catalog_price = df["Plat"].map(prices)
+            df["price"] = df["price"].fillna(catalog_price) if "price" in df.columns else catalog_price
+        append_to_archive(df, name, compress=compress, compacted=stamps)
+    for path in done:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(done)
+
+
+# === Lecture avec élimination de blocs ===
+def read_block(name, block, columns=ARCHIVE_COLUMNS):
+    with np.load(os.path.join(_archive_dir(name), block["file"])) as data:
+        return pd.DataFrame({
+            col: (data[f"{col}.dict"][data[f"{col}.codes"]] if col in TEXT_COLUMNS else data[col])
+            for col in ARCHIVE_COLUMNS if col in columns
+        })
+
+
+def block_sources(name):
+    # {chemin: (jeton, chargeur)} ; un bloc n'est jamais réécrit, son nom de fichier sert de jeton
+    return {
+        os.path.join(_archive_dir(name), block["file"]): (block["file"], lambda block=block: read_block(name, block))
+        for block in read_index(name)
+    }
+
+
+def _overlaps(zone, low, high):
+    if zone is None:
+        return low is None and high is None
+    return (low is None or zone[1] >= low) and (high is None or zone[0] <= high)
+
+
+def scan_archive(name, date_from=None, date_to=None, plat=None, order_range=(None, None),
+                 price_range=(None, None), columns=None):
+    # Retourne (lignes, statistiques) ; les blocs hors zone ne sont pas ouverts
+    date_from = date_from.isoformat() if date_from else None
+    date_to = date_to.isoformat() if date_to else None
+    plat_lower = plat.lower() if plat else None
+    columns = columns or ARCHIVE_COLUMNS
+    index = read_index(name)
+    frames = []
+    for block in index:
+        if not _overlaps(block["date_livraison"], date_from, date_to):
+            continue
+        if not _overlaps(block["order_number"], *order_range) or not _overlaps(block["price"], *price_range):
+            continue
+        if plat_lower and not any(plat_lower in p.lower() for p in block["plats"]):
+            continue
+        df = read_block(name, block, set(columns) | {"date_livraison", "Plat", "order_number", "price"})
+        mask = pd.Series(True, index=df.index)
+        if date_from:
+            mask &= df["date_livraison"] >= pd.Timestamp(date_from)
+        if date_to:
+            mask &= df["date_livraison"] <= pd.Timestamp(date_to)
+        if plat_lower:
+            mask &= df["Plat"].str.lower().str.contains(plat_lower, regex=False)
+        for col, (low, high) in (("order_number", order_range), ("price", price_range)):
+            if low is not None:
+                mask &= df[col] >= low
+            if high is not None:
+                mask &= df[col] <= high
+        frames.append(df.loc[mask, [c for c in ARCHIVE_COLUMNS if c in columns]])
+    result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    if "order_number" in result.columns:
+        result["order_number"] = result["order_number"].astype("Int64")
+    return result, {"blocs_lus": len(frames), "blocs_total": len(index)}
@@ -0,0 +1,189 @@
+# Mesures de performance des traitements de commandes : python bench.py
+import re
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregates import MaterializedAggregates
+from datasets import DatasetRegistry
+from transforms import empty_overlay, fold_editor_state, extract_delivery_dates, intern_orders, pivot_orders, unpivot_orders, MaterializedPivot, PIVOT_INDEX
+
+JOURS = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+
+
+def make_plats(n_lines, n_titles=50, seed=0):
+    rng = np.random.default_rng(seed)
+    # Titres réalistes : jour de la semaine cohérent avec la date, dans les semaines récentes
+    start = pd.Timestamp.today().normalize() - pd.Timedelta(days=21)
+    days = [start + pd.Timedelta(days=i % 35) for i in range(n_titles)]
+    titles = [f"{JOURS[d.weekday()]} {d:%d/%m}: Plat numéro {i} et sa garniture de saison" for i, d in enumerate(days)]
+    return pd.Series(np.array(titles, dtype=object)[rng.integers(0, n_titles, n_lines)], name="Plat")
+
+
+def timed(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Ancienne version (main.py avant la vectorisation), gardée comme référence
+def extract_date_from_name(name):
+    match = re.search(r"(\d{2}/\d{2})", str(name))
+    if match:
+        try:
+            return datetime.strptime(match.group(1) + f"/{datetime.today().year}", "%d/%m/%Y")
+        except:
+            return None
+    return None
+
+
+def bench_delivery_dates(n_lines=100_000):
+    plats = make_plats(n_lines)
+    t_old, old = timed(lambda: plats.apply(extract_date_from_name), repeat=1)
+    t_new, new = timed(lambda: extract_delivery_dates(plats))
+    assert (pd.to_datetime(old) == new).all()
+    print(f"Dates de livraison ({n_lines} lignes) : apply {t_old * 1000:.0f} ms -> vectorisé {t_new * 1000:.1f} ms "
+          f"(x{t_old / t_new:.0f})")
+
+
+# Ancienne sauvegarde du pivot éditable (boucles imbriquées), gardée comme référence
+def unpivot_loop(edited_pivot, plats):
+    lines = []
+    for idx, row in edited_pivot.iterrows():
+        for plat in plats:
+            qty = row[plat]
+            if qty > 0:
+                lines.append({
+                    "order_number": row.get("order_number", None),
+                    "Nom": row["Nom"],
+                    "Plat": plat,
+                    "quantity": qty,
+                    "source_name": row["source_name"],
+                    "note": row["note"]
+                })
+    return pd.DataFrame(lines)
+
+
+def make_lines(n_orders, n_dishes=50, lines_per_order=4, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_orders * lines_per_order
+    order_numbers = np.repeat(np.arange(1000, 1000 + n_orders), lines_per_order)
+    names = np.array([f"Client numéro {i} de la région bruxelloise" for i in range(n_orders)], dtype=object)
+    return pd.DataFrame({
+        "order_number": order_numbers,
+        "Plat": make_plats(n, n_dishes, seed).to_numpy(),
+        "Nom": names[order_numbers - 1000],
+        "quantity": rng.integers(1, 4, n).astype(float),
+        "source_name": "web",
+        "note": "",
+    })
+
+
+def bench_pivot(n_orders=5_000):
+    lines = make_lines(n_orders)
+    t_text, _ = timed(lambda: lines.pivot_table(index=PIVOT_INDEX, columns="Plat", values="quantity",
+                                                aggfunc="sum", fill_value=0).reset_index())
+    t_intern, interned = timed(lambda: intern_orders(lines))
+    t_codes, _ = timed(lambda: pivot_orders(interned))
+    mem_text = lines[["Plat", "Nom"]].memory_usage(deep=True, index=False).sum()
+    mem_codes = interned[["plat_code", "client_code"]].memory_usage(index=False).sum()
+    print(f"Pivot ({len(lines)} lignes) : clés texte {t_text * 1000:.0f} ms -> codes int32 {t_codes * 1000:.0f} ms "
+          f"(+ {t_intern * 1000:.0f} ms une fois à l'ingestion) ; clés {mem_text // 1024} Ko -> {mem_codes // 1024} Ko")
+
+
+def bench_materialized_pivot(n_orders=5_000, n_partitions=20):
+    lines = make_lines(n_orders)
+    size = -(-len(lines) // n_partitions)
+    parts = {f"p{i}": lines.iloc[i * size:(i + 1) * size] for i in range(n_partitions)}
+    pivot = MaterializedPivot()
+    pivot.refresh({k: (0, lambda part=part: part) for k, part in parts.items()})
+    pivot.page(0, 50)
+    t_noop, _ = timed(lambda: pivot.refresh({k: (0, lambda part=part: part) for k, part in parts.items()}))
+    edited = parts["p3"].copy()
+    edited.iloc[0, edited.columns.get_loc("quantity")] += 1
+    sources = {k: (1 if k == "p3" else 0, lambda part=(edited if k == "p3" else part): part) for k, part in parts.items()}
+    start = time.perf_counter()
+    pivot.refresh(sources)
+    pivot.page(0, 50)
+    t_edit = time.perf_counter() - start
+    t_full, _ = timed(lambda: pivot_orders(lines))
+    stats = pivot.stats()
+    print(f"Pivot matérialisé ({len(lines)} lignes, {n_partitions} partitions) : sans changement {t_noop * 1000:.2f} ms, "
+          f"une partition modifiée + page de 50 {t_edit * 1000:.0f} ms, recalcul complet {t_full * 1000:.0f} ms ; "
+          f"{stats['cellules']} cellules non nulles au lieu de {stats['lignes'] * stats['plats']}")
+
+
+def bench_unpivot(n_orders=1_000, n_dishes=200):
+    wide = pivot_orders(make_lines(n_orders, n_dishes, lines_per_order=8))
+    plats = [col for col in wide.columns if col not in PIVOT_INDEX]
+    t_loop, _ = timed(lambda: unpivot_loop(wide, plats), repeat=1)
+    t_melt, lines = timed(lambda: unpivot_orders(wide, plats))
+    print(f"Dépivotage ({len(wide)} commandes x {len(plats)} plats -> {len(lines)} lignes) : "
+          f"boucles {t_loop * 1000:.0f} ms -> melt {t_melt * 1000:.1f} ms (x{t_loop / t_melt:.0f})")
+
+
+def bench_aggregates(n_orders=20_000, n_sources=150):
+    # Historique long : une source par semaine (partition ou bloc d'archive)
+    lines = make_lines(n_orders)
+    lines["price"] = 12.5
+    lines["date_livraison"] = extract_delivery_dates(lines["Plat"])
+    size = -(-len(lines) // n_sources)
+    parts = {f"s{i}": lines.iloc[i * size:(i + 1) * size] for i in range(n_sources)}
+    aggregates = MaterializedAggregates()
+    t_build, _ = timed(lambda: aggregates.refresh({k: (0, lambda part=part: part) for k, part in parts.items()}), repeat=1)
+    t_noop, _ = timed(lambda: aggregates.refresh({k: (0, lambda part=part: part) for k, part in parts.items()}))
+    edited = parts["s7"].copy()
+    edited.iloc[0, edited.columns.get_loc("quantity")] += 1
+    start = time.perf_counter()
+    aggregates.refresh({k: (1 if k == "s7" else 0, lambda part=(edited if k == "s7" else part): part) for k, part in parts.items()})
+    aggregates.by_day_dish(), aggregates.by_customer()
+    t_edit = time.perf_counter() - start
+    t_view, _ = timed(lambda: (aggregates.by_day_dish(), aggregates.by_customer()))
+    print(f"Agrégats ({len(lines)} lignes, {n_sources} sources) : construction {t_build * 1000:.0f} ms, "
+          f"sans changement {t_noop * 1000:.2f} ms, une source modifiée {t_edit * 1000:.0f} ms, "
+          f"lecture des vues {t_view * 1000:.3f} ms")
+
+
+def session_memory(make_session, n_sessions):
+    tracemalloc.start()
+    sessions = [make_session() for _ in range(n_sessions)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sessions
+    return size
+
+
+def bench_sessions(n_orders=20_000, n_sessions=50):
+    # Mémoire gardée par les sessions : copie complète par session -> bail sur la version partagée + overlay
+    orders = make_lines(n_orders)
+    registry = DatasetRegistry()
+    edit = {"edited_rows": {0: {"quantity": 3}}, "added_rows": [], "deleted_rows": []}
+
+    def copy_session():
+        return {"orders_df": orders.copy()}
+
+    def shared_session():
+        lease = registry.acquire("orders", 1, lambda: orders.copy())
+        overlay = fold_editor_state(empty_overlay(), orders.index, orders.index[:50], edit)
+        return {"orders_lease": lease, "overlay": overlay}
+
+    one = session_memory(copy_session, 1)
+    copies = session_memory(copy_session, n_sessions)
+    shared = session_memory(shared_session, n_sessions)
+    print(f"Sessions ({len(orders)} lignes, {n_sessions} sessions) : une session {one / 1e6:.1f} Mo, "
+          f"copies {copies / 1e6:.1f} Mo -> partagé {shared / 1e6:.1f} Mo")
+
+
+if __name__ == "__main__":
+    bench_delivery_dates()
+    bench_pivot()
+    bench_materialized_pivot()
+    bench_unpivot()
+    bench_aggregates()
+    bench_sessions()
@@ -0,0 +1,73 @@
+# Jeux de données partagés entre les sessions d'un processus : une seule copie par (nom, version),
+# comptée par référence. Chaque session ne garde qu'un bail (et ses propres modifications, à part).
+import threading
+import weakref
+
+import pandas as pd
+
+from shared_store import single_flight
+
+# Copy-on-write : toujours actif à partir de pandas 3, activé explicitement avant (pandas 2.2)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+
+class DatasetLease:
+    # Tenu dans st.session_state ; la référence est rendue quand le bail est remplacé ou que la session disparaît
+    __slots__ = ("name", "version", "_frame", "__weakref__")
+
+    def __init__(self, name, version, frame):
+        self.name = name
+        self.version = version
+        self._frame = frame
+
+    @property
+    def frame(self):
+        # Copie superficielle : avec le copy-on-write (activé ci-dessus), une modification faite par la session
+        # copie seulement les colonnes touchées, la version partagée reste intacte
+        return self._frame.copy(deep=False)
+
+
+class DatasetRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {}    # (nom, version) -> DataFrame partagé
+        self._refs = {}      # (nom, version) -> nombre de baux vivants
+        self._latest = {}    # nom -> dernière version (gardée sans bail, pour les prochaines sessions)
+
+    def acquire(self, name, version, loader):
+        key = (name, version)
+        with self._lock:
+            frame = self._frames.get(key)
+        if frame is None:
+            # Plusieurs sessions demandent la même version en même temps : un seul chargement
+            loaded = single_flight(("dataset", name, version), loader)
+            with self._lock:
+                frame = self._frames.setdefault(key, loaded)
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+            previous = self._latest.get(name)
+            self._latest[name] = version
+            if previous is not None and previous != version:
+                self._evict((name, previous))
+        lease = DatasetLease(name, version, frame)
+        weakref.finalize(lease, self._release, key)
+        return lease
+
+    def _release(self, key):
+        with self._lock:
+            self._refs[key] -= 1
+            self._evict(key)
+
+    def _evict(self, key):
+        # Appelé avec le verrou : version sans bail et dépassée -> libérée
+        if self._refs.get(key, 0) <= 0 and self._latest.get(key[0]) != key[1]:
+            self._frames.pop(key, None)
+            self._refs.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {key: self._refs.get(key, 0) for key in self._frames}
+
+
+DATASETS = DatasetRegistry()
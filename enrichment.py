@@ -0,0 +1,156 @@
+# Enrichissement des lignes de commande (fiche client, catalogue) par tables indexées sur les codes entiers
+import threading
+
+import numpy as np
+import pandas as pd
+
+from transforms import CUSTOMERS, DISHES, intern_orders
+
+CUSTOMER_COLUMNS = ["Itinéraire", "email", "telephone", "adresse", "ville"]
+SYNTHESE_COLUMNS = ["order_number", "Nom", "Plat", "quantity", "price", "total", "source_name", "note",
+                    "Itinéraire", "email", "telephone", "adresse", "ville"]
+
+
+class LookupTable:
+    # Code entier (Interner) -> position dans la table ; les colonnes sont gardées en tableaux numpy
+    def __init__(self, interner, keys, columns):
+        codes = interner.encode(keys).to_numpy()
+        rows = np.arange(len(codes))
+        self._positions = np.full(len(interner), -1, dtype="int64")
+        # En cas de doublon, la première ligne l'emporte (affectation dans l'ordre inverse)
+        known = codes >= 0
+        self._positions[codes[known][::-1]] = rows[known][::-1]
+        self.columns = {col: np.asarray(values) for col, values in columns.items()}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def codes(self):
+        # Codes présents dans la table, dans l'ordre des lignes
+        codes = np.flatnonzero(self._positions >= 0)
+        return codes[np.argsort(self._positions[codes], kind="stable")]
+
+    def positions(self, codes):
+        codes = np.asarray(codes, dtype="int64")
+        # Codes attribués après la construction de la table : absents
+        inside = (codes >= 0) & (codes < len(self._positions))
+        positions = np.full(len(codes), -1, dtype="int64")
+        positions[inside] = self._positions[codes[inside]]
+        return positions
+
+    def take(self, positions, column):
+        values = self.columns[column]
+        if not len(values):
+            return np.full(len(positions), np.nan, dtype="object")
+        taken = values[np.clip(positions, 0, None)]
+        if taken.dtype.kind in "fc":
+            return np.where(positions >= 0, taken, np.nan)
+        if taken.dtype.kind == "M":
+            return np.where(positions >= 0, taken, np.datetime64("NaT"))
+        return np.where(positions >= 0, taken.astype(object), np.nan)
+
+
+def _customer_table(clients):
+    if "Nom" not in clients.columns:
+        return LookupTable(CUSTOMERS, pd.Series([], dtype=object), {})
+    return LookupTable(CUSTOMERS, clients["Nom"], {col: clients[col] for col in CUSTOMER_COLUMNS if col in clients.columns})
+
+
+def _catalog_table(dim):
+    if dim.empty:
+        return LookupTable(DISHES, pd.Series([], dtype=object), {"price": np.array([], dtype="float64")})
+    return LookupTable(DISHES, dim["title"].astype(object), {
+        "price": dim["price"].to_numpy("float64"),
+        "date_livraison": dim["date_livraison"].to_numpy(),
+        **{col: dim[col].to_numpy() for col in ["type", "plat"] if col in dim.columns},
+    })
+
+
+class OrderEnricher:
+    # Tables de correspondance reconstruites seulement quand leur jeton de version change
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._tables = {}
+        self._options = {}     # liste -> (version, options des menus déroulants)
+
+    def _table(self, name, source, build):
+        token, loader = source
+        with self._lock:
+            if name not in self._tables or self._tokens[name] != token:
+                self._tables[name] = build(loader())
+                self._tokens[name] = token
+            return self._tables[name]
+
+    def customers(self, source):
+        return self._table("customers", source, _customer_table)
+
+    def catalog(self, source):
+        return self._table("catalog", source, _catalog_table)
+
+    def _cached_options(self, name, version, build):
+        with self._lock:
+            cached = self._options.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        options = build()
+        with self._lock:
+            self._options[name] = (version, options)
+        return options
+
+    def dish_options(self, catalog, since):
+        # Plats du catalogue livrés à partir de `since` (semaines affichées par les éditeurs), triés ;
+        # calculés une fois par version du catalogue, pas à chaque réexécution
+        def build():
+            table = self.catalog(catalog)
+            if "date_livraison" not in table.columns:
+                return []
+            codes = table.codes()
+            dates = pd.to_datetime(table.take(table.positions(codes), "date_livraison"))
+            return sorted(DISHES.decode(codes[np.asarray(dates >= since)]))
+        return self._cached_options("plats", (catalog[0], since), build)
+
+    def customer_options(self, customers):
+        # Noms de la fiche client indexée, triés ; une fois par version de Clients.csv
+        def build():
+            table = self.customers(customers)
+            return sorted(CUSTOMERS.decode(table.codes()))
+        return self._cached_options("clients", customers[0], build)
+
+    def enrich(self, orders, customers, catalog, columns=SYNTHESE_COLUMNS):
+        # customers / catalog : (jeton, chargeur) ; customers peut être None.
+        # Une seule passe : chaque colonne est prise par position (take) sur les codes client / plat,
+        # la valeur de la commande reste prioritaire sur celle de la fiche client ou du catalogue
+        customer_table = self.customers(customers) if customers else _customer_table(pd.DataFrame())
+        catalog_table = self.catalog(catalog)
+        orders = intern_orders(orders)
+        customer_pos = customer_table.positions(orders["client_code"])
+        catalog_pos = catalog_table.positions(orders["plat_code"])
+
+        out = {}
+        for col in columns:
+            if col == "price":
+                catalog_price = catalog_table.take(catalog_pos, "price")
+                if "price" in orders.columns:
+                    price = pd.to_numeric(orders["price"], errors="coerce").to_numpy("float64")
+                    out[col] = np.where(np.isnan(price), catalog_price, price)
+                else:
+                    out[col] = catalog_price
+            elif col == "total":
+                quantity = pd.to_numeric(orders["quantity"], errors="coerce").fillna(0).to_numpy("float64")
+                out[col] = out["price"] * quantity
+            elif col in customer_table.columns:
+                from_client = customer_table.take(customer_pos, col)
+                if col in orders.columns:
+                    values = orders[col].to_numpy(dtype=object)
+                    out[col] = np.where(pd.isna(values), from_client, values)
+                else:
+                    out[col] = from_client
+            elif col in catalog_table.columns:
+                out[col] = catalog_table.take(catalog_pos, col)
+            elif col in orders.columns:
+                out[col] = orders[col].to_numpy()
+        return pd.DataFrame(out, index=orders.index)
+
+
+ENRICHER = OrderEnricher()
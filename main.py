@@ -3,10 +3,21 @@ import streamlit as st
 import pandas as pd
 import requests
 import os
-import re
+import time
 from datetime import datetime, timedelta
 import csv
 
+from storage import fingerprint_df, save_csv, load_csv, save_orders, load_orders, upsert_lines, route_lines, hot_weeks, migrate_flat_orders, file_source, partition_sources, OrderNumberAllocator
+from archive import compact_orders, scan_archive
+from enrichment import ENRICHER
+from datasets import DATASETS
+from aggregates import ORDER_AGGREGATES, order_sources
+from production import production_plan, production_sheet, plan_to_pdf
+from transforms import extract_delivery_dates, build_product_dim, product_positions, take_from_dim, pivot_edit_changes, unpivot_orders, empty_overlay, fold_editor_state, apply_overlay, ORDER_PIVOT
+from startup import STARTUP
+from shared_store import cached_fetch, warm_value, single_flight, refresh_status, invalidate, bump_version, get_version, sync_shared_caches
+
+debut_script = time.perf_counter()
 st.set_page_config(page_title="Commandes Shopify enrichies", layout="wide")
 # st.title("🍭️ Gestion des commandes Shopify")
 
@@ -14,40 +25,97 @@ st.set_page_config(page_title="Commandes Shopify enrichies", layout="wide")
 
 mode = "Prod"  # Remplacez cela par 'Prod' pour le mode production
 
-if mode == "Prod":
+
+@st.cache_resource(show_spinner=False)
+def read_params(file_path, mtime):
+    # Lu une fois par processus et par version du fichier (mtime dans la clé du cache), pas à chaque réexécution
     params = {}
-    with open("param.txt", "r") as f:
+    with open(file_path, "r") as f:
         exec(f.read(), params)
+    return params
+
+
+if mode == "Prod":
+    params = read_params("param.txt", os.stat("param.txt").st_mtime_ns)
     ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
     CUSTOMER_PATH = params["CUSTOMER_PATH"]
     API_VERSION = "2025-01"
     SHOPIFY_DOMAIN = params["SHOPIFY_DOMAIN"]
 else:
-    params = {}
     # Chemin vers le fichier param.txt un niveau au-dessus du répertoire actuel
-    file_path = os.path.join(os.path.dirname(__file__), '..', 'param.txt')
-
-    with open(file_path, "r") as f:
-        exec(f.read(), params)
+    chemin_params = os.path.join(os.path.dirname(__file__), '..', 'param.txt')
+    params = read_params(chemin_params, os.stat(chemin_params).st_mtime_ns)
     ACCESS_TOKEN = params["ACCESS_TOKEN"]
     CUSTOMER_PATH = params["CUSTOMER_PATH"]
     API_VERSION = "2025-01"
     SHOPIFY_DOMAIN = params["SHOPIFY_DOMAIN"]
 
+# Cache des commandes Shopify (secondes, surchargeables dans param.txt) : durée de vie, puis délai pendant
+# lequel la valeur périmée reste affichée pendant son rafraîchissement en arrière-plan
+SHOPIFY_ORDERS_TTL = float(params.get("SHOPIFY_ORDERS_TTL", 300))
+SHOPIFY_ORDERS_MAX_STALE = float(params.get("SHOPIFY_ORDERS_MAX_STALE", 24 * 3600))
 
 
-# === Précharger données globales ===
-clients_info = pd.read_csv("Clients.csv") if os.path.exists("Clients.csv") else pd.DataFrame()
-noms_clients = sorted(clients_info["Nom"].dropna().unique()) if "Nom" in clients_info.columns else []
+
+# === Stockage des commandes par semaine de livraison (tâche de démarrage, voir startup.py) ===
+def prepare_order_storage():
+    migrate_flat_orders("commandes", "commandes.csv", quoting=csv.QUOTE_NONNUMERIC)
+    migrate_flat_orders("commandes_additionnelles", "commandes_additionnelles.csv")
+    # Semaines passées -> archive froide (prix complétés depuis le catalogue pour les zone maps)
+    catalogue = load_csv("produits_prices.csv")
+    prix_catalogue = catalogue.set_index("title")["price"].to_dict() if not catalogue.empty else None
+    compact_orders("commandes", prices=prix_catalogue)
+    compact_orders("commandes_additionnelles", prices=prix_catalogue)
+
+# Numéros des commandes manuelles : bloc réservé par session (voir sequence_commandes.json)
+if "order_numbers" not in st.session_state:
+    st.session_state["order_numbers"] = OrderNumberAllocator()
+
 sources = ["web", "non web"]
 
 # print(ACCESS_TOKEN)
 
-plats_disponibles = []
-if os.path.exists("commandes.csv"):
-    plats_disponibles = sorted(pd.read_csv("commandes.csv")["Plat"].dropna().unique())
+# === Chargeurs de données (préchargés en parallèle, voir preload_sources ; attendus par les pages qui les affichent) ===
+def preloaded(name):
+    # Résultat d'un préchargement ; copie superficielle des DataFrame (la version partagée reste intacte).
+    # Tâche en échec (quelle que soit l'erreur) : message affiché et tableau vide, la page reste utilisable
+    try:
+        result = STARTUP.wait(name)[0]
+    except Exception as exc:
+        st.error(f"❌ {name} : {exc}")
+        return pd.DataFrame()
+    return result.copy(deep=False) if isinstance(result, pd.DataFrame) else result
+
+
+def load_client_names():
+    # Options des menus « Nom » : fiche client indexée (voir enrichment.py)
+    return ENRICHER.customer_options(source_clients)
+
+
+def load_plats_disponibles(plats_affiches):
+    # Options des menus « Plat » : catalogue des semaines affichées (semaine courante et suivantes),
+    # à défaut de catalogue les plats des commandes de ces semaines. Les plats des lignes affichées restent
+    # proposés même s'ils ne sont plus au catalogue : sinon la cellule de ces lignes serait invalide
+    debut_semaine = pd.Timestamp.today().normalize() - pd.Timedelta(days=pd.Timestamp.today().weekday())
+    plats = ENRICHER.dish_options(source_catalogue, debut_semaine)
+    if not plats and produits_dim.empty:
+        commandes_semaine = load_orders("commandes")
+        plats = list(commandes_semaine["Plat"].dropna().unique()) if "Plat" in commandes_semaine.columns else []
+    hors_catalogue = set(pd.Series(plats_affiches, dtype=object).dropna().astype(str)) - set(plats)
+    return sorted([*plats, *hors_catalogue]) if hors_catalogue else plats
+
 
 # === Fonctions ===
+def shopify_get(url):
+    # Requêtes identiques simultanées (même URL, donc même endpoint et mêmes paramètres) :
+    # un seul appel à l'API, (statut, JSON) partagé par toutes les sessions qui attendent
+    def call():
+        headers = {"Content-Type": "application/json", "X-Shopify-Access-Token": ACCESS_TOKEN}
+        response = requests.get(url, headers=headers)
+        return response.status_code, (response.json() if response.status_code == 200 else None)
+    return single_flight(("GET", url), call)
+
+
 def read_csv_flexible_encoding(file_path):
     encodings = ["utf-8", "utf-8-sig", "latin1"]
     for enc in encodings:
@@ -59,22 +127,16 @@ def read_csv_flexible_encoding(file_path):
     return None
 
 
-def get_products_and_prices():
-    # Paramètres Shopify
-    url_collects = f"https://{SHOPIFY_DOMAIN}/admin/api/{API_VERSION}/collects.json?limit=250"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": ACCESS_TOKEN
-    }
-
+def fetch_products_and_prices():
+    # Lève une exception en cas d'erreur ; les fichiers ne sont alors pas modifiés
     # 1. Récupérer les collects (collection_id, product_id)
-    response = requests.get(url_collects, headers=headers)
-    if response.status_code != 200:
-        st.error(f"Erreur récupération collects: {response.status_code}")
-        return
+    url_collects = f"https://{SHOPIFY_DOMAIN}/admin/api/{API_VERSION}/collects.json?limit=250"
+    status, data = shopify_get(url_collects)
+    if status != 200:
+        raise RuntimeError(f"Erreur récupération collects: {status}")
 
-    collects = response.json().get("collects", [])
-    product_ids = list({str(collect["product_id"]) for collect in collects})  # unique ids
+    collects = data.get("collects", [])
+    product_ids = sorted({str(collect["product_id"]) for collect in collects})  # ids uniques, URL stable
 
     # 2. Pour tous les products ids, récupérer les produits
     products_info = []
@@ -83,12 +145,11 @@ def get_products_and_prices():
     ids_param = ",".join(product_ids)
     url_products = f"https://{SHOPIFY_DOMAIN}/admin/api/{API_VERSION}/products.json?ids={ids_param}"
 
-    response = requests.get(url_products, headers=headers)
-    if response.status_code != 200:
-        st.error(f"Erreur récupération produits: {response.status_code}")
-        return
+    status, data = shopify_get(url_products)
+    if status != 200:
+        raise RuntimeError(f"Erreur récupération produits: {status}")
 
-    products = response.json().get("products", [])
+    products = data.get("products", [])
 
     # 3. Extraire titre principal et prix du premier variant
     for product in products:
@@ -109,71 +170,156 @@ def get_products_and_prices():
     # 4. Sauvegarder dans produits_prices.csv (en écrasant)
     products_df = pd.DataFrame(products_info)
     products_df.to_csv("produits_prices.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+    bump_version("produits_prices.csv")
+
+    # 5. Table de dimension produits : date, jour, plat, type et prix, une fois par rafraîchissement
+    save_csv(build_product_dim(products_df), "produits_dim.csv", immediate=True)
+
 
+def prepare_catalogue():
+    # Tâche de démarrage : catalogue téléchargé seulement s'il n'existe pas encore
+    if not os.path.exists("produits_prices.csv"):
+        single_flight("products_refresh", fetch_products_and_prices)
+
+
+def get_products_and_prices():
+    # Plusieurs sessions cliquent en même temps : un seul rafraîchissement (appels API et écriture des fichiers)
+    try:
+        single_flight("products_refresh", fetch_products_and_prices)
+    except (requests.RequestException, RuntimeError) as e:
+        st.error(str(e))
+
+
+def build_product_dim_file(_previous=None):
+    dim = load_csv("produits_dim.csv", parse_dates=["date_livraison"])
+    if dim.empty:
+        produits = load_csv("produits_prices.csv")
+        if not produits.empty:
+            dim = build_product_dim(produits)
+            save_csv(dim, "produits_dim.csv", immediate=True)
+    return dim
+
+
+def read_product_dim():
+    # Préchargée à chaque nouvelle version partagée de produits_dim.csv (après chaque rafraîchissement) ;
+    # copie persistée (cache chaud) servie au démarrage sans relire ni analyser le CSV
+    stamp = (get_version("produits_dim.csv"),
+             os.path.getmtime("produits_dim.csv") if os.path.exists("produits_dim.csv") else None)
+    return warm_value("produits_dim", stamp, build_product_dim_file)
+
+
+# === Index du dossier des fiches clients (cache chaud persisté) ===
+def _customer_entry(path, name, known):
+    # (mtime_ns, champs de la première ligne ou None) ; fiche relue seulement si sa date de modification a changé.
+    # OSError remonte à l'appelant (fichier supprimé ou illisible)
+    file_path = os.path.join(path, name)
+    mtime = os.stat(file_path).st_mtime_ns
+    return known if known is not None and known[0] == mtime else (mtime, read_csv_flexible_encoding(file_path))
+
+
+def scan_customer_folder(previous, path=CUSTOMER_PATH):
+    # {fichier: (mtime_ns, champs de la première ligne ou None)} ; seuls les fichiers nouveaux ou modifiés sont relus.
+    # Fichier illisible : (None, None), signalé pour ce fichier seulement
+    previous = previous or {}
+    index = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".csv"):
+                continue
+            try:
+                index[entry.name] = _customer_entry(path, entry.name, previous.get(entry.name))
+            except FileNotFoundError:
+                continue  # supprimé pendant le parcours
+            except OSError:
+                index[entry.name] = (None, None)
+    return index
+
+
+def customer_index(path=CUSTOMER_PATH):
+    # Tampon : date de modification du dossier (fichier ajouté ou supprimé). Une fiche modifiée sur place ne change
+    # pas ce tampon : sa date de modification est revérifiée à la lecture (read_client_details, load_all_clients)
+    if not os.path.isdir(path):
+        return {}
+    return warm_value(f"index_fiches_clients:{path}", os.stat(path).st_mtime_ns,
+                      lambda previous: scan_customer_folder(previous, path), revalidate_after=60)
 
 
 def load_all_clients(path):
+    # Fiches du jour : dates de modification relues (index réutilisé pour le contenu des fiches inchangées)
+    if not os.path.isdir(path):
+        return pd.DataFrame()
     today = datetime.today().date()
     clients = []
-    for file in os.listdir(path):
-        full_path = os.path.join(path, file)
-        if file.endswith(".csv") and datetime.fromtimestamp(os.path.getmtime(full_path)).date() == today:
-            try:
-                with open(full_path, "r", encoding="utf-8") as f:
-                    fields = f.readline().strip().split(";")
-                    if len(fields) >= 8:
-                        clients.append({
-                            "Nom": f"{fields[3]} {fields[4]}",
-                            "email": fields[0],
-                            "telephone": fields[5],
-                            "adresse": fields[6],
-                            "ville": fields[7],
-                            "Itinéraire": ""
-                        })
-            except Exception as e:
-                st.warning(f"Erreur lecture {file} : {e}")
+    for file, (mtime, fields) in scan_customer_folder(customer_index(path), path).items():
+        if mtime is not None and datetime.fromtimestamp(mtime / 1e9).date() != today:
+            continue
+        if fields is None:
+            st.warning(f"Erreur lecture {file}")
+        elif len(fields) >= 8:
+            clients.append({
+                "Nom": f"{fields[3]} {fields[4]}",
+                "email": fields[0],
+                "telephone": fields[5],
+                "adresse": fields[6],
+                "ville": fields[7],
+                "Itinéraire": ""
+            })
     return pd.DataFrame(clients)
 
-def get_client_details(customer_ids, path=CUSTOMER_PATH):
-    def read_csv_flexible_encoding(file_path):
-        encodings = ["utf-8", "utf-8-sig", "latin1"]
-        for enc in encodings:
-            try:
-                with open(file_path, "r", encoding=enc) as f:
-                    return f.readline().strip().split(";")
-            except Exception:
-                continue
-        return None
-
+def read_client_details(customer_ids, path=CUSTOMER_PATH):
+    # (fiches, avertissements {customer_id: message}) ; sans appel Streamlit, utilisable en préchargement.
+    # Première ligne de chaque fiche prise dans l'index du dossier si la fiche n'a pas changé depuis, sinon relue
+    index = customer_index(path)
     client_data = []
+    avertissements = {}
     for cid in customer_ids:
-        file_path = os.path.join(path, f"{cid}.csv")
-        if os.path.exists(file_path):
-            fields = read_csv_flexible_encoding(file_path)
-            if fields and len(fields) >= 8:
-                client_data.append({
-                    "customer_id": cid,
-                    "email": fields[0],
-                    "Nom": f"{fields[3]} {fields[4]}",
-                    "telephone": fields[5],
-                    "adresse": fields[6],
-                    "ville": fields[7]
-                })
-            else:
-                st.warning(f"⚠️ Client {cid} ignoré : fichier vide, invalide ou mal encodé.")
+        try:
+            _, fields = _customer_entry(path, f"{cid}.csv", index.get(f"{cid}.csv"))
+        except FileNotFoundError:
+            avertissements[cid] = f"⚠️ Fichier client {cid}.csv introuvable."
+            continue
+        except OSError as exc:
+            avertissements[cid] = f"⚠️ Client {cid} ignoré : fichier illisible ({exc})."
+            continue
+        if fields and len(fields) >= 8:
+            client_data.append({
+                "customer_id": cid,
+                "email": fields[0],
+                "Nom": f"{fields[3]} {fields[4]}",
+                "telephone": fields[5],
+                "adresse": fields[6],
+                "ville": fields[7]
+            })
         else:
-            st.warning(f"⚠️ Fichier client {cid}.csv introuvable.")
-    return pd.DataFrame(client_data)
+            avertissements[cid] = f"⚠️ Client {cid} ignoré : fichier vide, invalide ou mal encodé."
+    return pd.DataFrame(client_data, columns=["customer_id", "email", "Nom", "telephone", "adresse", "ville"]), avertissements
+
+
+def get_client_details(customer_ids):
+    # Fiches préchargées pour toutes les commandes Shopify ; seules les fiches absentes du préchargement sont relues
+    try:
+        fiches, avertissements = STARTUP.wait("fiches clients")[0]
+    except Exception:
+        # Préchargement en échec : toutes les fiches sont relues ci-dessous
+        fiches, avertissements = pd.DataFrame(columns=["customer_id"]), {}
+    connus = set(fiches["customer_id"]) | set(avertissements)
+    manquants = [cid for cid in customer_ids if cid not in connus]
+    if manquants:
+        lues, nouveaux = read_client_details(manquants)
+        fiches, avertissements = pd.concat([fiches, lues], ignore_index=True), {**avertissements, **nouveaux}
+    for cid in customer_ids:
+        if cid in avertissements:
+            st.warning(avertissements[cid])
+    return fiches[fiches["customer_id"].isin(customer_ids)].reset_index(drop=True)
 
 
 
-@st.cache_data(show_spinner="Chargement des commandes depuis Shopify...")
-def get_shopify_orders():
+def fetch_shopify_orders():
+    # Lève une exception en cas d'erreur : une erreur n'est jamais mise en cache
     url = f"https://{SHOPIFY_DOMAIN}/admin/api/{API_VERSION}/orders.json?status=any&limit=250"
-    headers = {"Content-Type": "application/json", "X-Shopify-Access-Token": ACCESS_TOKEN}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        orders = response.json().get("orders", [])
+    status, data = shopify_get(url)
+    if status == 200:
+        orders = data.get("orders", [])
         rows = []
         for order in orders:
             created_at = order.get("created_at")
@@ -187,6 +333,7 @@ def get_shopify_orders():
                 quantity = item.get("quantity", 1)
                 price = float(item.get("price", 0))
                 rows.append({
+                    "product_id": item.get("product_id"),   # clé de jointure avec le catalogue (product_key)
                     "order_number": order_number,
                     "created_at": created_at,
                     "customer_id": customer_id,
@@ -197,59 +344,270 @@ def get_shopify_orders():
                     "note": note
                 })
         return pd.DataFrame(rows)
-    else:
-        st.error(f"Erreur Shopify : {response.status_code}")
-        return pd.DataFrame()
+    raise RuntimeError(f"Erreur Shopify : {status}")
 
-def extract_date_from_name(name):
-    match = re.search(r"(\d{2}/\d{2})", str(name))
-    if match:
-        try:
-            return datetime.strptime(match.group(1) + f"/{datetime.today().year}", "%d/%m/%Y")
-        except:
-            return None
-    return None
+
+def fetch_cached_orders():
+    return cached_fetch("shopify_orders", fetch_shopify_orders, ttl=SHOPIFY_ORDERS_TTL, max_stale=SHOPIFY_ORDERS_MAX_STALE)
+
+
+def get_shopify_orders():
+    # (commandes, horodatage de récupération) ; partagées entre sessions et processus (shared_store)
+    try:
+        return fetch_cached_orders()
+    except Exception as exc:
+        # Réponse Shopify inattendue comprise : message affiché, pas de trace Streamlit
+        st.error(str(exc))
+        return pd.DataFrame(), None
+
+
+def fetched_caption(label, fetched_at):
+    if fetched_at is None:
+        return f"{label} : jamais récupéré"
+    minutes = int((datetime.now().timestamp() - fetched_at) // 60)
+    return f"{label} : récupéré le {datetime.fromtimestamp(fetched_at):%d/%m à %H:%M:%S} (il y a {minutes} min)"
+
+def pivot_pagination(prefix):
+    # Filtres + pagination du pivot : seule la page affichée est construite.
+    # Retourne aussi la vue (filtres, page, version du pivot) : elle change dès que les lignes affichées changent
+    col_plat, col_nom, col_taille, col_page = st.columns(4)
+    filtre_plat = col_plat.text_input("Filtrer par plat", key=f"{prefix}_plat") or None
+    filtre_nom = col_nom.text_input("Filtrer par client", key=f"{prefix}_nom") or None
+    taille = col_taille.selectbox("Lignes par page", [50, 100, 250, 1000], key=f"{prefix}_taille")
+    nb_lignes = ORDER_PIVOT.count(plat=filtre_plat, nom=filtre_nom)
+    nb_pages = max(1, -(-nb_lignes // taille))
+    page = col_page.number_input("Page", min_value=1, max_value=nb_pages, value=1, key=f"{prefix}_page")
+    page = min(page, nb_pages)
+    stats = ORDER_PIVOT.stats()
+    st.caption(f"{nb_lignes} commandes — page {page}/{nb_pages} — {stats['cellules']} cellules non nulles "
+               f"sur {stats['lignes'] * stats['plats']}")
+    vue = (filtre_plat, filtre_nom, taille, page, ORDER_PIVOT.version)
+    return ORDER_PIVOT.page((page - 1) * taille, taille, plat=filtre_plat, nom=filtre_nom), vue
+
+
+def with_filter_columns(df):
+    # Colonnes servant uniquement aux filtres des éditeurs paginés (jamais sauvegardées)
+    plats = df["Plat"] if "Plat" in df.columns else pd.Series(pd.NA, index=df.index, dtype="string")
+    livraison = extract_delivery_dates(plats).dt.strftime("%Y-%m-%d")
+    itineraire = ENRICHER.enrich(df, source_clients, source_catalogue, columns=["Itinéraire"]).get("Itinéraire")
+    if itineraire is None:
+        itineraire = pd.Series(pd.NA, index=df.index, dtype="object")
+    itineraire = itineraire.astype("string").str.replace(r"\.0$", "", regex=True)
+    return df.assign(Livraison=livraison, Itinéraire=itineraire)
+
+
+def paged_editor(key, source, columns, column_config, choice_filters=(), text_filters=()):
+    # Éditeur paginé : filtres et tri côté serveur, seule la fenêtre affichée part vers le navigateur.
+    # source : (jeton, chargeur) du tableau de base, chargé seulement quand le jeton change.
+    # Tableau partagé entre sessions (DATASETS) ; la session ne garde que ses modifications (overlay),
+    # reportées avant de changer de fenêtre. Retourne le tableau complet modifié (colonnes `columns`).
+    token, loader = source
+    if st.session_state.get(f"{key}_token") != token:
+        # Nouvelle version des données : les modifications en cours ne s'y appliquent pas, l'utilisateur choisit
+        editor_state = st.session_state.get(f"{key}_editor_{st.session_state.get(f'{key}_gen', 0)}", {})
+        pending = f"{key}_lease" in st.session_state and (
+            any(st.session_state[f"{key}_overlay"].values()) or any(editor_state.values()))
+        if pending and not st.button("🔄 Charger la nouvelle version (abandonne les modifications)", key=f"{key}_recharger"):
+            st.warning("⚠️ Les données ont changé depuis vos modifications non sauvegardées : "
+                       "sauvegardez-les ou chargez la nouvelle version.")
+        else:
+            st.session_state[f"{key}_token"] = token
+            st.session_state[f"{key}_lease"] = DATASETS.acquire(f"editeur_{key}", token,
+                                                                lambda: loader().reset_index(drop=True))
+            st.session_state[f"{key}_overlay"] = empty_overlay()
+            st.session_state[f"{key}_gen"] = st.session_state.get(f"{key}_gen", 0) + 1
+            st.session_state.pop(f"{key}_sig", None)
+    shared = st.session_state[f"{key}_lease"].frame
+    base = apply_overlay(shared, st.session_state[f"{key}_overlay"])
+
+    filtres = st.columns(len(choice_filters) + len(text_filters) or 1)
+    choix = {col: widget.selectbox(col, ["Tous"] + sorted(base[col].dropna().astype(str).unique()), key=f"{key}_filtre_{col}")
+             for widget, col in zip(filtres, choice_filters)}
+    textes = {col: widget.text_input(f"{col} contient", key=f"{key}_filtre_{col}")
+              for widget, col in zip(filtres[len(choice_filters):], text_filters)}
+    col_tri, col_ordre, col_taille, col_page = st.columns(4)
+    tri = col_tri.selectbox("Trier par", columns, key=f"{key}_tri")
+    decroissant = col_ordre.toggle("Décroissant", key=f"{key}_ordre")
+    taille = col_taille.selectbox("Lignes par page", [50, 100, 250, 500], key=f"{key}_taille")
+    page = col_page.number_input("Page", min_value=1, value=1, key=f"{key}_page")
+    signature = (tuple(choix.items()), tuple(textes.items()), tri, decroissant, taille, page)
+
+    # Fenêtre modifiée : on reporte ses modifications avant d'afficher la nouvelle
+    editor_key = f"{key}_editor_{st.session_state[f'{key}_gen']}"
+    previous = st.session_state.get(f"{key}_sig")
+    if previous is not None and previous != signature and editor_key in st.session_state:
+        overlay = fold_editor_state(st.session_state[f"{key}_overlay"], shared.index,
+                                    st.session_state[f"{key}_window"], st.session_state[editor_key])
+        st.session_state[f"{key}_overlay"] = overlay
+        base = apply_overlay(shared, overlay)
+        st.session_state[f"{key}_gen"] += 1
+        editor_key = f"{key}_editor_{st.session_state[f'{key}_gen']}"
+
+    mask = pd.Series(True, index=base.index)
+    for col, valeur in choix.items():
+        if valeur != "Tous":
+            mask &= base[col].astype(str) == valeur
+    for col, texte in textes.items():
+        if texte:
+            mask &= base[col].astype(str).str.contains(texte, case=False, regex=False)
+    nb_lignes = int(mask.sum())
+    nb_pages = max(1, -(-nb_lignes // taille))
+    page = min(page, nb_pages)
+
+    ordre = base.loc[mask, tri].sort_values(ascending=not decroissant, kind="stable").index
+    window = base.loc[ordre[(page - 1) * taille:page * taille], columns]
+    st.session_state[f"{key}_sig"] = signature
+    st.session_state[f"{key}_window"] = window.index
+    st.caption(f"{nb_lignes} lignes sur {len(base)} — page {page}/{nb_pages}")
+
+    # Index de position pour l'éditeur : les lignes ajoutées n'ont pas d'index à saisir
+    st.data_editor(window.reset_index(drop=True), key=editor_key, num_rows="dynamic", use_container_width=True,
+                   hide_index=True, column_config=column_config)
+    overlay = fold_editor_state(st.session_state[f"{key}_overlay"], shared.index, window.index,
+                                st.session_state.get(editor_key, {}))
+    return apply_overlay(shared, overlay)[columns]
+
+
+def forget_edits(key):
+    # Modifications sauvegardées : le tableau est rechargé au prochain affichage, sans avertissement
+    st.session_state.pop(f"{key}_token", None)
+    st.session_state.pop(f"{key}_lease", None)
+
+
+# === Synchronisation avec les autres processus Streamlit ===
+versions_partagees = sync_shared_caches()
+source_clients = file_source("Clients.csv", versions_partagees)
 
 # === Interface principale ===
-if not os.path.exists("produits_prices.csv"):
-    get_products_and_prices()
+# Travaux de démarrage lancés en arrière-plan (une fois par processus, compaction une fois par jour) :
+# l'en-tête et la navigation s'affichent sans attendre Shopify ni la taille des fichiers
+tache_stockage = f"stockage des commandes {datetime.today():%Y-%m-%d}"
+STARTUP.start(tache_stockage, prepare_order_storage)
+STARTUP.start("catalogue Shopify", prepare_catalogue)
+
+
+def preload_sources(names):
+    # Sources indépendantes chargées en même temps (chemin critique = la plus lente, pas leur somme) ;
+    # les fusions attendent leurs dépendances. Seules les sources demandées (et leurs dépendances) sont lancées,
+    # jetons compris. Une tâche n'est relancée que si sa version change, ou après un délai si elle a échoué.
+    taches = {
+        "dimension produits": ([], lambda: STARTUP.start(
+            "dimension produits", lambda _: read_product_dim(), after=["catalogue Shopify"],
+            token=get_version("produits_dim.csv"))),
+        "commandes Shopify": ([], lambda: STARTUP.start(
+            "commandes Shopify", fetch_cached_orders, token=versions_partagees.get("shopify_orders", 0))),
+        "index fiches clients": ([], lambda: STARTUP.start(
+            "index fiches clients", customer_index, token=datetime.today().date())),
+        "fiches clients": (["commandes Shopify", "index fiches clients"], lambda: STARTUP.start(
+            "fiches clients", lambda commandes, _: read_client_details(commandes[0]["customer_id"].dropna().unique()
+                                                                        if "customer_id" in commandes[0].columns else []),
+            after=["commandes Shopify", "index fiches clients"],
+            token=(versions_partagees.get("shopify_orders", 0), datetime.today().date()))),
+        "Clients.csv": ([], lambda: STARTUP.start("Clients.csv", source_clients[1], token=source_clients[0])),
+        "fiche clients indexée": (["Clients.csv"], lambda: STARTUP.start(
+            "fiche clients indexée", lambda clients: ENRICHER.customers((source_clients[0], lambda: clients)),
+            after=["Clients.csv"], token=source_clients[0])),
+        **{name: ([], lambda name=name: STARTUP.start(
+            name, lambda _: load_orders(name), after=[tache_stockage],
+            token=tuple(token for token, _ in partition_sources(name, versions_partagees).values())))
+           for name in ["commandes", "commandes_additionnelles"]},
+    }
+    lancees = set()
+
+    def lancer(name):
+        if name not in lancees:
+            lancees.add(name)
+            dependances, start = taches[name]
+            for dependance in dependances:
+                lancer(dependance)
+            start()
+
+    for name in names:
+        lancer(name)
+
 
 if st.button("🔄 Refresh Produits/Prix depuis Shopify"):
     with st.spinner("🔄 Rafraîchissement des produits et prix en cours..."):
         get_products_and_prices()
     st.success("Mise à jour terminée ✅")
+if os.path.exists("produits_prices.csv"):
+    st.caption(fetched_caption("Produits/prix Shopify", os.path.getmtime("produits_prices.csv")))
 
 
-tabs = st.tabs(["Commandes Shopify", "Ajouter des commandes", "Clients", "Synthèse", "Pivot", "Pivot éditable"])
+
+# === Page Commandes Shopify ===
+@st.fragment
+def shopify_editor(shopify_source, plats_options, noms_options):
+    # Fragment : une modification du tableau ne réexécute que l'éditeur et sa sauvegarde
+    edited_shopify = paged_editor(
+        "shopify",
+        shopify_source,
+        ["order_number", "Plat", "Nom", "quantity", "source_name", "note"],
+        column_config={
+            "Plat": st.column_config.SelectboxColumn("Plat", options=plats_options, required=True),
+            "Nom": st.column_config.SelectboxColumn("Nom", options=noms_options, required=True),
+            "source_name": st.column_config.SelectboxColumn("Source", options=sources)
+        },
+        choice_filters=["Livraison", "Itinéraire"],
+        text_filters=["Nom", "Plat"],
+    )
+
+    # ✅ Sauvegarde automatique : écrite seulement si le contenu a changé (écriture différée)
+    if st.button("📅 Sauvegarder commandes Shopify"):
+        save_orders(edited_shopify, "commandes", scope=hot_weeks("commandes"), immediate=True, quoting=csv.QUOTE_NONNUMERIC)
+        st.success("Commandes Shopify sauvegardées.")
+    else:
+        save_orders(edited_shopify, "commandes", scope=hot_weeks("commandes"), quoting=csv.QUOTE_NONNUMERIC)
 
 
-# === Onglet Commandes Shopify ===
-with tabs[0]:
+def page_shopify():
     st.header("🔵 Commandes Shopify")
     
     if "reload_shopify" not in st.session_state:
         st.session_state["reload_shopify"] = True
 
     if st.button("🔄 Rafraîchir commandes Shopify"):
+        # Invalidation explicite : la prochaine lecture retélécharge (dans tous les processus)
+        versions_partagees["shopify_orders"] = invalidate("shopify_orders")
+        st.session_state["reload_shopify"] = True
+
+    # Commandes rafraîchies par un autre processus depuis le dernier chargement
+    if st.session_state.get("version_shopify") != versions_partagees.get("shopify_orders", 0):
+        st.session_state["reload_shopify"] = True
+    # Données périmées : relues (valeur périmée servie, rafraîchissement lancé en arrière-plan)
+    fetched_at = st.session_state.get("shopify_fetched_at")
+    if fetched_at is not None and datetime.now().timestamp() - fetched_at >= SHOPIFY_ORDERS_TTL:
         st.session_state["reload_shopify"] = True
 
     if st.session_state["reload_shopify"]:
-        orders_df = get_shopify_orders()
-        st.session_state["orders_df"] = orders_df.copy()
+        with st.spinner("Chargement des commandes depuis Shopify..."):
+            orders_df, fetched_at = get_shopify_orders()
+        # Une copie par version des commandes pour tout le processus, pas une par session
+        st.session_state["orders_lease"] = DATASETS.acquire("shopify_orders", fetched_at, lambda: orders_df)
+        st.session_state["shopify_fetched_at"] = fetched_at
         st.session_state["reload_shopify"] = False
-    else:
-        orders_df = st.session_state.get("orders_df", pd.DataFrame())
+        st.session_state["version_shopify"] = get_version("shopify_orders")
+    orders_df = st.session_state["orders_lease"].frame
+
+    en_cours, erreur = refresh_status("shopify_orders")
+    st.caption(fetched_caption("Commandes Shopify", fetched_at) + (" — rafraîchissement en cours…" if en_cours else ""))
+    if erreur:
+        st.warning(f"⚠️ Dernier rafraîchissement en échec ({datetime.fromtimestamp(erreur[1]):%H:%M:%S}) : {erreur[0]}")
 
     if not orders_df.empty:
-        orders_df.rename(columns={"name": "Plat"}, inplace=True)  # 🔥 On renomme 'name' tout de suite
+        orders_df = orders_df.rename(columns={"name": "Plat"})  # 🔥 On renomme 'name' tout de suite (copie de la session)
 
         # Correction : travailler sur 'Plat' et non 'name'
         orders_df["created_at"] = pd.to_datetime(orders_df["created_at"].astype(str).str[:10], format="%Y-%m-%d")
         debut_annee = pd.to_datetime(f"{datetime.today().year}-01-01", format="%Y-%m-%d")
         start_week = datetime.today() - timedelta(days=datetime.today().weekday())
 
-        # Extraire date livraison une seule fois (optimisé)
-        orders_df["date_livraison"] = orders_df["Plat"].apply(extract_date_from_name)
+        # Date de livraison depuis la dimension produits (position dans le catalogue), titres hors catalogue analysés une fois
+        positions = product_positions(orders_df["Plat"], produits_dim, orders_df.get("product_id"))
+        orders_df["date_livraison"] = pd.to_datetime(take_from_dim(positions, produits_dim, "date_livraison"))
+        hors_catalogue = positions < 0
+        if hors_catalogue.any():
+            orders_df.loc[hors_catalogue, "date_livraison"] = extract_delivery_dates(orders_df.loc[hors_catalogue, "Plat"])
 
         orders_df = orders_df[
             (orders_df["created_at"] >= debut_annee) &
@@ -257,10 +615,6 @@ with tabs[0]:
             (orders_df["date_livraison"] >= start_week)
         ]
 
-        # ✅ Sauvegarder toutes les commandes récupérées dans commandes.csv
-        save_df = orders_df[["order_number", "Plat", "customer_id", "quantity", "source_name", "note"]]
-        save_df.to_csv("commandes.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
-
         # Maintenant affichage
         client_df = pd.DataFrame()
         if not orders_df["customer_id"].dropna().empty:
@@ -269,49 +623,32 @@ with tabs[0]:
         full_df = orders_df.merge(client_df, on="customer_id", how="left")
 
         shopify_display = full_df[["order_number", "Plat", "Nom", "quantity", "source_name", "note"]]
-        edited_shopify = st.data_editor(
-            shopify_display,
-            num_rows="dynamic",
-            use_container_width=True,
-            column_config={
-                "Plat": st.column_config.SelectboxColumn("Plat", options=plats_disponibles, required=True),
-                "Nom": st.column_config.SelectboxColumn("Nom", options=noms_clients, required=True),
-                "source_name": st.column_config.SelectboxColumn("Source", options=sources)
-            }
-        )
-
-        if st.button("📅 Sauvegarder commandes Shopify"):
-            edited_shopify.to_csv("commandes.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
-            st.success("Commandes Shopify sauvegardées.")
-
-edited_shopify.to_csv("commandes.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
-st.success("Commandes Shopify sauvegardées.")
+        # Jeton des données affichées : version des commandes, fiches clients (petit tableau), Clients.csv,
+        # catalogue et semaine courante ; le tableau complet n'est plus empreinté à chaque réexécution
+        jeton = (st.session_state["orders_lease"].version, fingerprint_df(client_df), source_clients[0],
+                 source_catalogue[0], start_week.date())
+        shopify_editor((jeton, lambda: with_filter_columns(shopify_display)), load_plats_disponibles(shopify_display["Plat"]),
+                       load_client_names())
 
 
 # === Ajouter des commandes manuellement ===
-with tabs[1]:
-    st.header("🔹 Ajouter des commandes manuellement")
-    colonnes = ["order_number", "Plat", "Nom", "quantity", "source_name", "note"]
-    if os.path.exists("commandes_additionnelles.csv"):
-        initial_df = pd.read_csv("commandes_additionnelles.csv")
-    else:
-        initial_df = pd.DataFrame(columns=["Plat", "Nom", "quantity", "source_name", "note"])
-    # st.success("Initial DF")
-    # st.success(initial_df)
-    edited_new = st.data_editor(
-        initial_df,
-        num_rows="dynamic",
-        use_container_width=True,
+@st.fragment
+def additions_editor(initial_df, token, plats_options, noms_options):
+    edited_new = paged_editor(
+        "ajout",
+        (token, lambda: with_filter_columns(initial_df)),
+        list(initial_df.columns),
         column_config={
-            "Plat": st.column_config.SelectboxColumn("Plat", options=plats_disponibles, required=True),
-            "Nom": st.column_config.SelectboxColumn("Nom", options=noms_clients, required=True),
+            "Plat": st.column_config.SelectboxColumn("Plat", options=plats_options, required=True),
+            "Nom": st.column_config.SelectboxColumn("Nom", options=noms_options, required=True),
             "source_name": st.column_config.SelectboxColumn("Source", options=sources)
-        }
+        },
+        choice_filters=["Livraison", "Itinéraire"],
+        text_filters=["Nom", "Plat"],
     )
 
-
     if st.button("📅 Sauvegarder commandes additionnelles"):
-        existing = pd.read_csv("commandes_additionnelles.csv") if os.path.exists("commandes_additionnelles.csv") else pd.DataFrame()
+        existing = load_orders("commandes_additionnelles")
 
         # S'assurer que order_number est présent et int
         existing["order_number"] = pd.to_numeric(existing.get("order_number"), errors="coerce").fillna(0).astype(int)
@@ -323,9 +660,8 @@ with tabs[1]:
         to_add = edited_new[edited_new["order_number"].isna()]
 
         # Créer de nouveaux order_numbers pour les lignes à ajouter
-        last_number = existing["order_number"].max() if not existing.empty else 1000
         to_add = to_add.copy()
-        to_add["order_number"] = range(last_number + 1, last_number + 1 + len(to_add))
+        to_add["order_number"] = st.session_state["order_numbers"].allocate(len(to_add))
 
         # Mettre à jour les lignes existantes
         if not to_update.empty:
@@ -338,28 +674,31 @@ with tabs[1]:
         final_df = pd.concat([existing, to_add], ignore_index=True)
 
         # Sauvegarder
-        final_df.to_csv("commandes_additionnelles.csv", index=False)
+        save_orders(final_df, "commandes_additionnelles", scope=hot_weeks("commandes_additionnelles"), immediate=True)
         st.success("Commandes additionnelles sauvegardées.")
+        forget_edits("ajout")
+        st.rerun()  # recharge la page : nouvelles lignes avec leur numéro de commande
 
 
+def page_ajout():
+    st.header("🔹 Ajouter des commandes manuellement")
+    colonnes = ["order_number", "Plat", "Nom", "quantity", "source_name", "note"]
+    initial_df = preloaded("commandes_additionnelles")
+    if initial_df.columns.empty:
+        initial_df = pd.DataFrame(columns=["Plat", "Nom", "quantity", "source_name", "note"])
+    # st.success("Initial DF")
+    # st.success(initial_df)
+    # Jeton du préchargement (partitions lues) + sources des colonnes de filtre
+    jeton = (STARTUP.token("commandes_additionnelles"), source_clients[0], source_catalogue[0])
+    additions_editor(initial_df, jeton, load_plats_disponibles(initial_df.get("Plat")), load_client_names())
 
 
-
-with tabs[2]:
-    st.header("👥 Informations clients")
-    colonnes_clients = ["Nom", "email", "telephone", "adresse", "ville", "Itinéraire"]
-
-    # 🔥 Initialisation : charger dans st.session_state
-    if "clients_df" not in st.session_state:
-        from_path = load_all_clients(CUSTOMER_PATH)
-        from_csv = pd.read_csv("Clients.csv") if os.path.exists("Clients.csv") else pd.DataFrame(columns=colonnes_clients)
-        initial_clients_df = pd.concat([from_csv, from_path], ignore_index=True)
-        initial_clients_df = initial_clients_df.drop_duplicates(subset="Nom", keep="last")
-        st.session_state["clients_df"] = initial_clients_df
-
-    # 🔥 Edition en live
+@st.fragment
+def clients_editor():
+    # 🔥 Edition en live : tableau partagé, les modifications de la session restent dans l'état de l'éditeur
     edited_clients = st.data_editor(
-        st.session_state["clients_df"],
+        st.session_state["clients_lease"].frame,
+        key="clients_editor",
         num_rows="dynamic",
         use_container_width=True,
         column_config={
@@ -368,192 +707,261 @@ with tabs[2]:
         }
     )
 
-    # 🔥 Stockage de l'édition en session_state pour garder en mémoire
-    st.session_state["clients_df"] = edited_clients
-
     if st.button("💾 Sauvegarder clients"):
-        st.session_state["clients_df"].to_csv("Clients.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+        save_csv(edited_clients, "Clients.csv", immediate=True, quoting=csv.QUOTE_NONNUMERIC)
         st.success("✅ Clients sauvegardés dans Clients.csv")
+        st.rerun()  # listes de clients des autres éditeurs
+
+
+def page_clients():
+    st.header("👥 Informations clients")
+    colonnes_clients = ["Nom", "email", "telephone", "adresse", "ville", "Itinéraire"]
 
+    def load_initial_clients():
+        from_path = load_all_clients(CUSTOMER_PATH)
+        # Clients.csv déjà lu par le préchargement de la page (même jeton que source_clients)
+        from_csv = preloaded("Clients.csv")
+        if from_csv.columns.empty:
+            from_csv = pd.DataFrame(columns=colonnes_clients)
+        initial_clients_df = pd.concat([from_csv, from_path], ignore_index=True)
+        return initial_clients_df.drop_duplicates(subset="Nom", keep="last")
 
+    # 🔥 Initialisation : un bail sur la liste partagée (Clients.csv + fiches du jour), chargée une fois par version
+    if "clients_lease" not in st.session_state:
+        version = (source_clients[0],
+                   os.path.getmtime(CUSTOMER_PATH) if os.path.isdir(CUSTOMER_PATH) else None,
+                   datetime.today().date())
+        st.session_state["clients_lease"] = DATASETS.acquire("clients", version, load_initial_clients)
 
+    clients_editor()
 
 
 # === Synthèse des commandes ===
-with tabs[3]:
+def page_synthese():
     st.header("🧾 Synthèse consolidée des commandes")
-    df1 = pd.read_csv("commandes.csv") if os.path.exists("commandes.csv") else pd.DataFrame()
-    df2 = pd.read_csv("commandes_additionnelles.csv", sep=",", quotechar='"') if os.path.exists("commandes_additionnelles.csv") else pd.DataFrame()
+    df1 = preloaded("commandes")
+    df2 = preloaded("commandes_additionnelles")
     df_all = pd.concat([df1, df2], ignore_index=True)
 
-    clients_info = pd.read_csv("Clients.csv") if os.path.exists("Clients.csv") else pd.DataFrame()
-    produits_prices = pd.read_csv("produits_prices.csv") if os.path.exists("produits_prices.csv") else pd.DataFrame()
-
-    final_df = df_all.merge(clients_info, on="Nom", how="left")
-
-    # Supprimer colonnes inutiles
-    final_df.drop(columns=[col for col in final_df.columns if col.lower().startswith("unnamed") or col == "customer_id"], inplace=True, errors="ignore")
-
-    # Fusion champs _x/_y
-    for col in ["email", "telephone", "adresse", "ville", "Itinéraire"]:
-        col_x, col_y = f"{col}_x", f"{col}_y"
-        if col_x in final_df.columns and col_y in final_df.columns:
-            final_df[col] = final_df[col_x].combine_first(final_df[col_y])
-            final_df.drop(columns=[col_x, col_y], inplace=True)
-
-    # ========== 🆕 ICI : Ajout du prix manquant depuis produits_prices.csv ==========
-    if not produits_prices.empty:
-        # Créer un dictionnaire rapide {title: price}
-        prix_map = produits_prices.set_index("title")["price"].to_dict()
-        
-        # Ajouter colonne price si elle n'existe pas
-        if "price" not in final_df.columns:
-            final_df["price"] = final_df["Plat"].map(prix_map).astype(float)
-        else:
-            # Compléter uniquement les prix manquants
-            final_df["price"] = final_df["price"].fillna(final_df["Plat"].map(prix_map).astype(float))
-    else:
+    # Fiche client et prix catalogue pris par code entier ; tables réutilisées tant que Clients.csv
+    # et le catalogue ne changent pas
+    final_df = ENRICHER.enrich(
+        df_all,
+        customers=source_clients,
+        catalog=source_catalogue,
+    )
+    if produits_dim.empty:
         st.warning("⚠️ Fichier produits_prices.csv non trouvé ou vide. Pas de correspondance des prix possible.")
 
-    # Calcul du total
-    final_df["total"] = final_df["price"] * final_df["quantity"].fillna(0)
-
-    # Réorganiser les colonnes
-    final_order = ["order_number", "Nom", "Plat", "quantity", "price", "total", "source_name", "note", "Itinéraire", "email", "telephone", "adresse", "ville"]
-    final_df = final_df[[col for col in final_order if col in final_df.columns]]
-
     st.dataframe(final_df, use_container_width=True)
     st.markdown(f"### 💰 Total global : **{final_df['total'].sum():.2f} €**")
 
+    # === Historique : requêtes sur l'archive froide ===
+    with st.expander("🗄️ Historique des commandes (archive)"):
+        col_debut, col_fin, col_plat = st.columns(3)
+        debut = col_debut.date_input("Livraison du", value=datetime.today().date() - timedelta(days=90))
+        fin = col_fin.date_input("au", value=datetime.today().date())
+        plat_recherche = col_plat.text_input("Plat contient")
+        if st.button("🔎 Rechercher dans l'archive"):
+            resultats = []
+            blocs_lus = blocs_total = 0
+            for fichier in ["commandes", "commandes_additionnelles"]:
+                lignes, stats = scan_archive(fichier, date_from=debut, date_to=fin, plat=plat_recherche or None)
+                resultats.append(lignes)
+                blocs_lus += stats["blocs_lus"]
+                blocs_total += stats["blocs_total"]
+            historique = pd.concat([df for df in resultats if not df.empty] or resultats[:1], ignore_index=True)
+            historique["total"] = historique["price"] * historique["quantity"].fillna(0)
+            st.dataframe(historique, use_container_width=True)
+            st.caption(f"{len(historique)} lignes — {blocs_lus}/{blocs_total} blocs lus")
+            st.markdown(f"**Total : {historique['total'].sum():.2f} €**")
+
 
 # === Pivot
-with tabs[4]:
+def page_pivot():
     st.header("📊 Tableau croisé des commandes par plat")
-    
-    df1 = pd.read_csv("commandes.csv") if os.path.exists("commandes.csv") else pd.DataFrame()
-    if "note" in df1.columns:
-        df1["note"] = df1["note"].fillna("")
-    if "source_name" in df1.columns:
-        df1["source_name"] = df1["source_name"].fillna("")
-
-    df2 = pd.read_csv("commandes_additionnelles.csv", sep=",", quotechar='"') if os.path.exists("commandes_additionnelles.csv") else pd.DataFrame()
-    df_all = pd.concat([df1, df2], ignore_index=True)
-
-
-    df_all["Plat"] = df_all["Plat"].astype(str)
-    df_all["quantity"] = pd.to_numeric(df_all["quantity"], errors="coerce").fillna(0)
 
-    pivot_df = df_all.pivot_table(
-        index=["order_number", "Nom", "source_name", "note"],
-        columns="Plat",
-        values="quantity",
-        aggfunc="sum",
-        fill_value=0
-    ).reset_index()
-
-    pivot_df["Total commandes"] = pivot_df.drop(columns=["order_number", "Nom", "source_name", "note"]).sum(axis=1)
+    # Pivot matérialisé : seules les semaines modifiées depuis le dernier affichage sont relues
+    ORDER_PIVOT.refresh({
+        **partition_sources("commandes", versions_partagees),
+        **partition_sources("commandes_additionnelles", versions_partagees),
+    })
+    pivot_df, _ = pivot_pagination("pivot")
 
     st.dataframe(pivot_df, use_container_width=True)
+    st.markdown("**Total par plat**")
+    st.dataframe(ORDER_PIVOT.dish_totals(), use_container_width=True)
+
+    st.download_button(
+        "⬇️ Exporter la page en lignes de commande (CSV)",
+        unpivot_orders(pivot_df).to_csv(index=False).encode("utf-8"),
+        file_name="commandes_pivot.csv",
+        mime="text/csv",
+    )
 
-with tabs[5]:
-    st.header("✏️ Pivot éditable des commandes")
-    
-    df1 = pd.read_csv("commandes.csv") if os.path.exists("commandes.csv") else pd.DataFrame()
-    if "note" in df1.columns:
-        df1["note"] = df1["note"].fillna("")
-    if "source_name" in df1.columns:
-        df1["source_name"] = df1["source_name"].fillna("")
-
-    df2 = pd.read_csv("commandes_additionnelles.csv") if os.path.exists("commandes_additionnelles.csv") else pd.DataFrame()
-    df_all = pd.concat([df1, df2], ignore_index=True)
-
-    # Assurer cohérence
-    df_all["Plat"] = df_all["Plat"].astype(str)
-    df_all["quantity"] = pd.to_numeric(df_all["quantity"], errors="coerce").fillna(0)
-
-    pivot_edit = df_all.pivot_table(
-        index=["order_number", "Nom", "source_name", "note"],
-        columns="Plat",
-        values="quantity",
-        aggfunc="sum",
-        fill_value=0
-    ).reset_index()
-
-    plats = [col for col in pivot_edit.columns if col not in ["order_number", "Nom", "source_name", "note"]]
+@st.fragment
+def pivot_editor(pivot_edit, plats, noms_options, vue):
+    # Les positions de edited_rows ne valent que pour la page affichée : nouvel éditeur à chaque changement de vue
+    if st.session_state.get("pivot_editor_vue") != vue:
+        previous = f"pivot_editor_{st.session_state.get('pivot_editor_gen', 0)}"
+        if st.session_state.get("pivot_editor_vue") is not None and any(st.session_state.get(previous, {}).values()):
+            st.warning("⚠️ Modifications non sauvegardées abandonnées : la page, les filtres ou les commandes ont changé.")
+        st.session_state["pivot_editor_vue"] = vue
+        st.session_state["pivot_editor_gen"] = st.session_state.get("pivot_editor_gen", 0) + 1
+    editor_key = f"pivot_editor_{st.session_state['pivot_editor_gen']}"
 
     edited_pivot = st.data_editor(
         pivot_edit,
         num_rows="dynamic",
         use_container_width=True,
+        key=editor_key,
         column_config={
-            "Nom": st.column_config.SelectboxColumn("Nom", options=noms_clients, required=True),
+            "Nom": st.column_config.SelectboxColumn("Nom", options=noms_options, required=True),
             "source_name": st.column_config.SelectboxColumn("Source", options=sources, required=True),
             **{plat: st.column_config.NumberColumn(plat, min_value=0, step=1) for plat in plats}
         }
     )
 
     if st.button("💾 Sauvegarder modifications Pivot"):
-        # Remettre sous forme ligne par plat
-        lines = []
-        for idx, row in edited_pivot.iterrows():
-            for plat in plats:
-                qty = row[plat]
-                if qty > 0:
-                    lines.append({
-                        "order_number": row.get("order_number", None),
-                        "Nom": row["Nom"],
-                        "Plat": plat,
-                        "quantity": qty,
-                        "source_name": row["source_name"],
-                        "note": row["note"]
-                    })
-        
-        new_df = pd.DataFrame(lines)
-
-        # Charger existant
-        commandes_file = "commandes.csv"
-        commandes_add_file = "commandes_additionnelles.csv"
-        
-        df_existing1 = pd.read_csv(commandes_file) if os.path.exists(commandes_file) else pd.DataFrame()
-        df_existing2 = pd.read_csv(commandes_add_file) if os.path.exists(commandes_add_file) else pd.DataFrame()
-
-        df_existing = pd.concat([df_existing1, df_existing2], ignore_index=True)
-
-        # Gérer les order_number
-        if "order_number" not in df_existing.columns:
-            df_existing["order_number"] = 0
-
-        df_existing["order_number"] = pd.to_numeric(df_existing["order_number"], errors="coerce").fillna(0).astype(int)
-
-        new_df["order_number"] = pd.to_numeric(new_df["order_number"], errors="coerce")
-
-        to_update = new_df[new_df["order_number"].notna()].astype({"order_number": int})
-        to_add = new_df[new_df["order_number"].isna()]
-
-        # Ajouter les nouveaux order_numbers
-        last_number = df_existing["order_number"].max() if not df_existing.empty else 1000
-        to_add = to_add.copy()
-        to_add["order_number"] = range(last_number + 1, last_number + 1 + len(to_add))
+        # Seules les cellules modifiées (état du data_editor) sont écrites, dans leurs semaines
+        changes = pivot_edit_changes(pivot_edit, st.session_state[editor_key], plats,
+                                     st.session_state["order_numbers"].allocate)
+        # Ligne existante ou déplacée (client, note... modifiés) : gardée dans son fichier d'origine ;
+        # ligne nouvelle : rangée selon sa source
+        nouveau = (changes["source_name"] == "web").map({True: "commandes", False: "commandes_additionnelles"})
+        routes = route_lines(changes, ["commandes", "commandes_additionnelles"], nouveau)
+        upsert_lines(routes["commandes"], "commandes", immediate=True, quoting=csv.QUOTE_NONNUMERIC)
+        upsert_lines(routes["commandes_additionnelles"], "commandes_additionnelles", immediate=True)
+        st.session_state["pivot_editor_vue"] = None   # modifications écrites : rien à signaler au rechargement
 
-        if not to_update.empty:
-            # ✅ Eliminer les doublons sur order_number
-            to_update = to_update.groupby("order_number").first()
-            
-            df_existing.set_index("order_number", inplace=True)
-            to_update = to_update.reindex_like(df_existing, method=None)  # Aligner index
-            df_existing.update(to_update)
-            df_existing.reset_index(inplace=True)
+        st.success("✅ Pivot sauvegardé correctement.")
+        st.rerun()
 
 
-        # Ajouter les nouvelles lignes
-        final_df = pd.concat([df_existing, to_add], ignore_index=True)
+def page_pivot_editable():
+    st.header("✏️ Pivot éditable des commandes")
 
-        # Sauver dans les deux fichiers
-        final_df1 = final_df[final_df["source_name"] == "web"]
-        final_df2 = final_df[final_df["source_name"] != "web"]
+    ORDER_PIVOT.refresh({
+        **partition_sources("commandes", versions_partagees),
+        **partition_sources("commandes_additionnelles", versions_partagees),
+    })
+    pivot_edit, vue = pivot_pagination("pivot_edit")
+    pivot_edit = pivot_edit.drop(columns=["Total commandes"])
 
-        final_df1.to_csv(commandes_file, index=False)
-        final_df2.to_csv(commandes_add_file, index=False)
+    plats = [col for col in pivot_edit.columns if col not in ["order_number", "Nom", "source_name", "note"]]
 
-        st.success("✅ Pivot sauvegardé correctement.")
-        st.rerun()
+    pivot_editor(pivot_edit, plats, load_client_names(), vue)
+
+
+# === Tableau de bord : agrégats matérialisés (historique complet, archive comprise) ===
+def page_tableau_de_bord():
+    st.header("📈 Tableau de bord")
+
+    # Seules les partitions / blocs modifiés depuis le dernier affichage sont relus
+    ORDER_AGGREGATES.refresh(order_sources(versions_partagees, source_catalogue))
+    par_jour = ORDER_AGGREGATES.by_day_dish()
+
+    if par_jour.empty:
+        st.info("Aucune commande à agréger.")
+    else:
+        dates_connues = par_jour["date_livraison"].dropna()
+        col_debut, col_fin = st.columns(2)
+        debut = col_debut.date_input("Livraisons du", value=dates_connues.min().date(), key="dashboard_debut")
+        fin = col_fin.date_input("au", value=dates_connues.max().date(), key="dashboard_fin")
+        periode = par_jour[(par_jour["date_livraison"] >= pd.Timestamp(debut)) & (par_jour["date_livraison"] <= pd.Timestamp(fin))]
+
+        col_ca, col_qte, col_jours = st.columns(3)
+        col_ca.metric("💰 Chiffre d'affaires", f"{periode['revenue'].sum():.2f} €")
+        col_qte.metric("🍽️ Plats commandés", f"{periode['quantity'].sum():.0f}")
+        col_jours.metric("📅 Jours de livraison", periode["date_livraison"].nunique())
+
+        st.markdown("**Chiffre d'affaires par semaine**")
+        semaines = periode.groupby(periode["date_livraison"].dt.to_period("W").dt.start_time)["revenue"].sum()
+        st.bar_chart(semaines)
+
+        st.markdown("**Plats les plus vendus**")
+        st.dataframe(periode.groupby("Plat")[["quantity", "revenue"]].sum().sort_values("revenue", ascending=False),
+                     use_container_width=True)
+
+    col_source, col_itineraire = st.columns(2)
+    col_source.markdown("**Par source**")
+    col_source.dataframe(ORDER_AGGREGATES.by_source(), use_container_width=True)
+    col_itineraire.markdown("**Par itinéraire**")
+    col_itineraire.dataframe(ORDER_AGGREGATES.by_route(source_clients), use_container_width=True)
+    st.markdown("**Par client**")
+    st.dataframe(ORDER_AGGREGATES.by_customer().drop(columns=["client_code"]), use_container_width=True)
+
+
+# === Production cuisine : portions par jour de livraison et par plat ===
+def page_production():
+    st.header("👨‍🍳 Plan de production cuisine")
+
+    # Même agrégat jour x plat que le tableau de bord (codes entiers, mis à jour par différence)
+    ORDER_AGGREGATES.refresh(order_sources(versions_partagees, source_catalogue))
+    col_debut, col_fin = st.columns(2)
+    aujourd_hui = datetime.today().date()
+    debut = col_debut.date_input("Livraisons du", value=aujourd_hui, key="production_debut")
+    fin = col_fin.date_input("au", value=aujourd_hui + timedelta(days=6), key="production_fin")
+    plan = production_plan(ORDER_AGGREGATES.by_day_dish(), debut, fin, ENRICHER.catalog(source_catalogue))
+
+    if plan.empty:
+        st.info("Aucune commande à produire sur cette période.")
+    else:
+        st.dataframe(production_sheet(plan), use_container_width=True, hide_index=True)
+        for (_, jour), jour_plan in plan.groupby(["date_livraison", "jour"]):
+            with st.expander(f"{jour} — {jour_plan['quantity'].sum()} portions"):
+                st.dataframe(jour_plan[["type", "plat", "quantity"]], use_container_width=True, hide_index=True)
+
+        col_csv, col_pdf = st.columns(2)
+        col_csv.download_button(
+            "⬇️ Export CSV",
+            plan.drop(columns=["Plat"]).to_csv(index=False).encode("utf-8"),
+            file_name=f"production_{debut:%Y%m%d}_{fin:%Y%m%d}.csv",
+            mime="text/csv",
+        )
+        col_pdf.download_button(
+            "⬇️ Export PDF",
+            plan_to_pdf(plan, f"Plan de production du {debut:%d/%m} au {fin:%d/%m}"),
+            file_name=f"production_{debut:%Y%m%d}_{fin:%Y%m%d}.pdf",
+            mime="application/pdf",
+        )
+
+
+# === Navigation : seule la page affichée est exécutée à chaque interaction ===
+# Chaque page avec les sources qu'elle précharge (voir preload_sources)
+pages = [
+    (st.Page(page_shopify, title="Commandes Shopify", icon="🛒", url_path="shopify", default=True),
+     ["commandes Shopify", "fiches clients", "fiche clients indexée"]),
+    (st.Page(page_ajout, title="Ajouter des commandes", icon="➕", url_path="ajout"),
+     ["commandes_additionnelles", "fiche clients indexée"]),
+    (st.Page(page_clients, title="Clients", icon="👥", url_path="clients"), ["index fiches clients", "Clients.csv"]),
+    (st.Page(page_synthese, title="Synthèse", icon="🧾", url_path="synthese"),
+     ["commandes", "commandes_additionnelles", "fiche clients indexée"]),
+    (st.Page(page_pivot, title="Pivot", icon="📊", url_path="pivot"), []),
+    (st.Page(page_pivot_editable, title="Pivot éditable", icon="✏️", url_path="pivot-editable"), ["fiche clients indexée"]),
+    (st.Page(page_tableau_de_bord, title="Tableau de bord", icon="📈", url_path="tableau-de-bord"), []),
+    (st.Page(page_production, title="Production cuisine", icon="👨‍🍳", url_path="production"), []),
+]
+navigation = st.navigation([page for page, _ in pages], position="top")
+STARTUP.mark("premier affichage", time.perf_counter() - debut_script)
+# Préchargement des sources de la page affichée seulement (la dimension produits sert à toutes les pages)
+preload_sources(["dimension produits", *next(sources for page, sources in pages if page is navigation)])
+
+# Données communes aux pages : attendues seulement maintenant, après le premier affichage
+if not (STARTUP.done(tache_stockage) and STARTUP.done("catalogue Shopify")):
+    with st.spinner("Préparation des données..."):
+        for tache in [tache_stockage, "catalogue Shopify"]:
+            try:
+                STARTUP.wait(tache)
+            except Exception as e:
+                st.error(f"{tache} : {e}")
+with st.expander("⏱️ Rapport de démarrage"):
+    st.dataframe(STARTUP.report(), hide_index=True, use_container_width=True)
+
+try:
+    produits_dim = STARTUP.wait("dimension produits")[0].copy(deep=False)
+except Exception:
+    # Catalogue Shopify indisponible (erreur affichée ci-dessus) : dimension existante
+    produits_dim = read_product_dim()
+source_catalogue = (get_version("produits_dim.csv"), lambda: produits_dim)
+navigation.run()
@@ -0,0 +1,159 @@
+# Plan de production cuisine : quantités par jour de livraison x plat (commandes Shopify + manuelles)
+import unicodedata
+
+import pandas as pd
+
+from transforms import JOURS_SEMAINE
+
+PDF_LINES_PER_PAGE = 60
+PDF_TEXT_WIDTH = 515        # points disponibles pour le texte (A4 = 595, marges de 40)
+PDF_TITLE_WIDTH = 450       # le numéro de page occupe la fin de la ligne de titre
+UNKNOWN_COURSE = "Non classé"   # type absent du titre du produit
+
+
+def production_plan(by_day_dish, start, end, catalog=None):
+    # Filtre l'agrégat jour x plat (déjà regroupé sur les codes entiers) ; une ligne par jour et par plat.
+    # catalog : table du catalogue indexée sur les codes plats (OrderEnricher.catalog), jointure sur entiers
+    dates = by_day_dish["date_livraison"]
+    plan = by_day_dish[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end)) & (by_day_dish["quantity"] > 0)]
+    plan = plan[["date_livraison", "Plat", "plat_code", "quantity"]].reset_index(drop=True)
+    plan["jour"] = [f"{JOURS_SEMAINE[d.weekday()]} {d:%d/%m}" for d in plan["date_livraison"]]
+    if catalog is not None and "type" in catalog.columns:
+        positions = catalog.positions(plan["plat_code"])
+        plan["type"] = pd.Series(catalog.take(positions, "type"), index=plan.index).fillna(UNKNOWN_COURSE)
+        plan["plat"] = pd.Series(catalog.take(positions, "plat"), index=plan.index).fillna(
+            plan["Plat"].str.partition(":")[2].str.strip())
+    else:
+        plan["type"] = UNKNOWN_COURSE
+        plan["plat"] = plan["Plat"].str.partition(":")[2].str.strip()
+    plan["quantity"] = plan["quantity"].round().astype("int64")
+    return plan.sort_values(["date_livraison", "type", "plat"], ignore_index=True)[
+        ["date_livraison", "jour", "type", "plat", "quantity", "Plat"]]
+
+
+def production_sheet(plan):
+    # Vue cuisine : un plat par ligne, un jour par colonne
+    if plan.empty:
+        return pd.DataFrame()
+    sheet = plan.pivot_table(index=["type", "plat"], columns="date_livraison", values="quantity",
+                             aggfunc="sum", fill_value=0)
+    sheet.columns = [f"{JOURS_SEMAINE[d.weekday()]} {d:%d/%m}" for d in sheet.columns]
+    sheet["Total"] = sheet.sum(axis=1)
+    return sheet.reset_index()
+
+
+# === Export PDF (texte simple, sans dépendance) ===
+# Largeurs Helvetica (millièmes de la taille de police) des caractères ASCII 32 à 126, d'après la métrique AFM
+_HELVETICA = dict(zip(map(chr, range(32, 127)), [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]))
+
+
+def _pdf_safe(text):
+    # Caractères hors WinAnsi (cp1252) : lettre de base si elle existe (ā -> a), sinon code visible <U+1F525>.
+    # Jamais de "?" silencieux.
+    out = []
+    for char in text:
+        try:
+            char.encode("cp1252")
+            out.append(char)
+            continue
+        except UnicodeEncodeError:
+            pass
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        try:
+            base.encode("cp1252")
+            out.append(base)
+        except UnicodeEncodeError:
+            out.append(f"<U+{ord(char):04X}>")
+    return "".join(out)
+
+
+def _pdf_width(text, size):
+    # Caractère accentué : largeur de sa lettre de base ; caractère inconnu : largeur maximale (1 em)
+    return sum(_HELVETICA.get(unicodedata.normalize("NFD", char)[0], 1000) for char in text) * size / 1000
+
+
+def _pdf_wrap(line, size, width=PDF_TEXT_WIDTH):
+    # Coupe aux espaces ; un mot plus large que la ligne est coupé là où il dépasse.
+    # Les suites gardent le retrait de la ligne, plus 4 espaces.
+    if _pdf_width(line, size) <= width:
+        return [line]
+    margin = line[:len(line) - len(line.lstrip(" "))]
+    wrapped, current = [], margin
+    for word in line.lstrip(" ").split(" "):
+        candidate = f"{current} {word}" if current.strip() else current + word
+        if _pdf_width(candidate, size) <= width:
+            current = candidate
+            continue
+        if current.strip():
+            wrapped.append(current)
+            current = margin + "    "
+        for char in word:
+            if current.strip() and _pdf_width(current + char, size) > width:
+                wrapped.append(current)
+                current = margin + "    "
+            current += char
+    return wrapped + [current]
+
+
+def _pdf_truncate(text, size, width):
+    if _pdf_width(text, size) <= width:
+        return text
+    while text and _pdf_width(text + "…", size) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("cp1252")
+
+
+def text_pdf(title, lines):
+    # PDF A4 minimal : police Helvetica, une ligne par entrée (coupée à la largeur de la page), pages ajoutées au besoin
+    title = _pdf_truncate(_pdf_safe(title), 14, PDF_TITLE_WIDTH)
+    lines = [part for line in lines for part in _pdf_wrap(_pdf_safe(line), 10)]
+    pages = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # arbre des pages, complété une fois les pages numérotées
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for number, page in enumerate(pages, start=1):
+        stream = b"BT /F1 14 Tf 40 800 Td (" + _pdf_text(title) + b") Tj ET\n"
+        stream += b"BT /F1 8 Tf 500 800 Td (" + _pdf_text(f"page {number}/{len(pages)}") + b") Tj ET\n"
+        stream += b"BT /F1 10 Tf 12 TL 40 770 Td\n"
+        stream += b"".join(b"(" + _pdf_text(line) + b") Tj T*\n" for line in page)
+        stream += b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def plan_to_pdf(plan, title="Plan de production"):
+    lines = []
+    for (_, jour), day in plan.groupby(["date_livraison", "jour"], sort=True):
+        lines += ["", f"{jour} - {day['quantity'].sum()} portions"]
+        for course, part in day.groupby("type", sort=False):
+            lines.append(f"  {course}")
+            lines += [f"    {qty:>4} x {plat}" for qty, plat in zip(part["quantity"], part["plat"])]
+    return text_pdf(title, lines[1:])
@@ -0,0 +1,199 @@
+# Cache partagé entre plusieurs processus Streamlit (SQLite local + numéros de version)
+import pickle
+import sqlite3
+import threading
+import time
+
+SHARED_DB = "cache_partage.sqlite"
+
+REFRESH_RETRY_DELAY = 15        # secondes avant de relancer un rafraîchissement en échec, doublées à chaque échec
+REFRESH_RETRY_MAX_DELAY = 600
+
+_local = threading.local()
+_refreshing = set()     # clés en cours de rafraîchissement en arrière-plan dans ce processus
+_refresh_errors = {}    # clé -> (message, horodatage) du dernier rafraîchissement en échec
+_refresh_failures = {}  # clé -> échecs successifs (délai avant la prochaine tentative)
+_refresh_lock = threading.Lock()
+_flights = {}           # clé -> appel en cours (single-flight)
+_flights_lock = threading.Lock()
+_validated = {}         # clé du cache chaud -> dernière vérification dans ce processus
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SHARED_DB, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, fetched_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        _local.conn = conn
+    return conn
+
+
+# === Valeurs partagées ===
+def shared_get(key):
+    # Retourne (valeur, horodatage de récupération) ou None
+    row = _connect().execute("SELECT value, fetched_at FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    return pickle.loads(row[0]), row[1]
+
+
+def shared_put(key, value, fetched_at=None):
+    _connect().execute(
+        "INSERT OR REPLACE INTO cache (key, value, fetched_at) VALUES (?, ?, ?)",
+        (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), fetched_at or time.time()),
+    )
+
+
+def shared_delete(key):
+    _connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+# === Versions ===
+def bump_version(scope):
+    conn = _connect()
+    conn.execute(
+        "INSERT INTO versions (scope, version) VALUES (?, 1) "
+        "ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+        (scope,),
+    )
+    return conn.execute("SELECT version FROM versions WHERE scope = ?", (scope,)).fetchone()[0]
+
+
+def get_version(scope):
+    row = _connect().execute("SELECT version FROM versions WHERE scope = ?", (scope,)).fetchone()
+    return row[0] if row else 0
+
+
+def invalidate(key, scope=None):
+    # Supprime une valeur partagée et prévient les autres processus
+    shared_delete(key)
+    return bump_version(scope or key)
+
+
+def sync_shared_caches():
+    # À appeler à chaque exécution du script : toutes les versions en une seule requête SQLite
+    return dict(_connect().execute("SELECT scope, version FROM versions").fetchall())
+
+
+# === Single-flight : appels identiques simultanés regroupés en un seul ===
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(key, func):
+    # Le premier appelant exécute func ; ceux qui arrivent pendant l'appel attendent et partagent
+    # son résultat (ou son exception). Rien n'est gardé une fois l'appel terminé.
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        flight.result = func()
+        return flight.result
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+# === Récupération avec durée de vie (TTL) et service de la valeur périmée pendant le rafraîchissement ===
+def _fetch_and_store(key, fetch):
+    # fetch() lève une exception en cas d'erreur : rien n'est alors écrit dans le cache.
+    # Sessions (et rafraîchissement en arrière-plan) simultanés : un seul téléchargement.
+    def run():
+        value = fetch()
+        fetched_at = time.time()
+        shared_put(key, value, fetched_at)
+        bump_version(key)
+        with _refresh_lock:
+            _refresh_errors.pop(key, None)
+            _refresh_failures.pop(key, None)
+        return value, fetched_at
+    return single_flight(("cached_fetch", key), run)
+
+
+def _refresh_in_background(key, fetch):
+    # Après un échec, pas de nouvelle tentative avant un délai croissant : service indisponible (ou 429),
+    # pas un appel par interaction et par session
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        error = _refresh_errors.get(key)
+        if error is not None:
+            delay = min(REFRESH_RETRY_MAX_DELAY, REFRESH_RETRY_DELAY * 2 ** (_refresh_failures.get(key, 1) - 1))
+            if time.time() - error[1] < delay:
+                return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            _fetch_and_store(key, fetch)
+        except Exception as exc:
+            with _refresh_lock:
+                _refresh_errors[key] = (str(exc), time.time())
+                _refresh_failures[key] = _refresh_failures.get(key, 0) + 1
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name=f"refresh-{key}", daemon=True).start()
+
+
+def cached_fetch(key, fetch, ttl, max_stale=None):
+    # Retourne (valeur, horodatage de récupération).
+    # - plus jeune que ttl : servie telle quelle
+    # - périmée depuis moins de max_stale : servie immédiatement, rafraîchie en arrière-plan
+    # - absente (ou invalidée) ou trop ancienne : récupérée maintenant ; une erreur remonte à l'appelant
+    entry = shared_get(key)
+    if entry is not None:
+        value, fetched_at = entry
+        age = time.time() - fetched_at
+        if age < ttl:
+            return entry
+        if max_stale is None or age < ttl + max_stale:
+            _refresh_in_background(key, fetch)
+            return entry
+    return _fetch_and_store(key, fetch)
+
+
+def refresh_status(key):
+    # (rafraîchissement en cours ?, dernière erreur (message, horodatage) ou None)
+    with _refresh_lock:
+        return key in _refreshing, _refresh_errors.get(key)
+
+
+# === Cache chaud persisté (survit aux redémarrages) ===
+def warm_value(key, stamp, build, revalidate_after=None):
+    # Entrée (tampon de version, valeur) gardée dans SQLite : servie dès le démarrage du processus.
+    # - même tampon : valeur persistée servie telle quelle, revérifiée en arrière-plan au premier accès
+    #   du processus (puis toutes les revalidate_after secondes)
+    # - tampon différent ou entrée absente : reconstruite maintenant
+    # build reçoit l'ancienne valeur (ou None) pour une reconstruction incrémentale.
+    cache_key = f"warm:{key}"
+    entry = shared_get(cache_key)
+    previous = entry[0] if entry is not None else None
+    now = time.time()
+    if previous is not None and previous[0] == stamp:
+        last = _validated.get(key)
+        if last is None or (revalidate_after is not None and now - last >= revalidate_after):
+            _validated[key] = now
+            _refresh_in_background(cache_key, lambda: (stamp, build(previous[1])))
+        return previous[1]
+    (_, value), _ = _fetch_and_store(cache_key, lambda: (stamp, build(previous[1] if previous is not None else None)))
+    _validated[key] = now
+    return value
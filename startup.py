@@ -0,0 +1,117 @@
+# Démarrage en arrière-plan : travaux ponctuels (migration, compaction, catalogue Shopify) et préchargement
+# des sources de données, lancés en parallèle sans bloquer le premier affichage. Une tâche peut dépendre
+# d'autres tâches (elle reçoit leurs résultats) ; durées gardées pour le rapport de démarrage.
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+
+RETRY_DELAY = 15          # secondes avant de relancer une tâche en échec, doublées à chaque nouvel échec
+RETRY_MAX_DELAY = 600
+
+
+class StartupTasks:
+    def __init__(self, max_workers=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self._lock = threading.Lock()
+        self._futures = {}     # nom -> Future (dernière version)
+        self._tokens = {}      # nom -> jeton de version de la tâche
+        self._retries = {}     # nom -> relances successives après échec (même jeton)
+        self._timings = {}     # nom -> [début, fin, erreur] (secondes depuis le démarrage du processus)
+        self.started_at = time.perf_counter()
+
+    def _run(self, future, timing, func, args, deps):
+        # Fin notée avant de résoudre la Future : le délai de relance d'un échec part de cette heure
+        try:
+            # Erreur d'une dépendance : la tâche échoue sans s'exécuter
+            results = [dep.result() for dep in deps]
+            timing[0] = time.perf_counter() - self.started_at
+            result = func(*args, *results)
+        except Exception as exc:
+            timing[1], timing[2] = time.perf_counter() - self.started_at, str(exc)
+            future.set_exception(exc)
+        else:
+            timing[1] = time.perf_counter() - self.started_at
+            future.set_result(result)
+
+    def _when_done(self, deps, launch):
+        # Lancée quand toutes les dépendances sont terminées : aucun thread ne reste bloqué à les attendre
+        remaining = [len(deps)]
+        lock = threading.Lock()
+
+        def one_done(_):
+            with lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                launch()
+
+        if not deps:
+            launch()
+        for dep in deps:
+            dep.add_done_callback(one_done)
+
+    def _retry_delay(self, name):
+        return min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** self._retries.get(name, 0))
+
+    def start(self, name, func, *args, after=(), token=None):
+        # Une seule exécution par nom et par jeton ; relancée si le jeton change, ou si elle a échoué une fois
+        # le délai de relance écoulé (service indisponible : pas un nouvel appel à chaque interaction).
+        # after : noms des tâches dont les résultats sont passés à func (après args).
+        with self._lock:
+            future = self._futures.get(name)
+            same = future is not None and self._tokens.get(name) == token
+            failed = same and future.done() and future.exception() is not None
+            if same and not failed:
+                return future
+            if failed:
+                failed_at = self._timings[name][1]
+                if time.perf_counter() - self.started_at - failed_at < self._retry_delay(name):
+                    return future
+                self._retries[name] = self._retries.get(name, 0) + 1
+            else:
+                self._retries.pop(name, None)
+            deps = [self._futures[dep] for dep in after]
+            future = self._futures[name] = Future()
+            timing = self._timings[name] = [None, None, None]
+            self._tokens[name] = token
+        self._when_done(deps, lambda: self._executor.submit(self._run, future, timing, func, args, deps))
+        return future
+
+    def wait(self, *names):
+        # Résultats des tâches (dans l'ordre demandé) ; l'erreur d'une tâche remonte à l'appelant
+        with self._lock:
+            futures = [self._futures[name] for name in names]
+        return [future.result() for future in futures]
+
+    def token(self, name):
+        # Jeton de la dernière version lancée : jeton de données des résultats de la tâche
+        with self._lock:
+            return self._tokens.get(name)
+
+    def done(self, name):
+        future = self._futures.get(name)
+        return future is not None and future.done()
+
+    def mark(self, name, seconds):
+        # Étape mesurée par l'appelant (ex. premier affichage)
+        with self._lock:
+            self._timings.setdefault(name, [0.0, seconds, None])
+
+    def report(self):
+        now = time.perf_counter() - self.started_at
+        rows = []
+        for name, (start, end, error) in list(self._timings.items()):
+            state = "erreur" if error else "terminé" if end is not None else "en cours" if start is not None else "en attente"
+            rows.append({
+                "étape": name,
+                "état": state,
+                "début (ms)": None if start is None else round(start * 1000),
+                "durée (ms)": None if start is None else round(((end if end is not None else now) - start) * 1000),
+                "erreur": error or "",
+            })
+        return pd.DataFrame(rows, columns=["étape", "état", "début (ms)", "durée (ms)", "erreur"])
+
+
+STARTUP = StartupTasks()
@@ -0,0 +1,440 @@
+# Stockage des fichiers de commandes (écriture différée + suivi des modifications)
+import atexit
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from shared_store import bump_version
+from transforms import extract_delivery_dates
+
+WRITE_DELAY = 2.0       # secondes d'inactivité avant d'écrire un fichier modifié
+WRITE_MAX_DELAY = 10.0  # délai maximum, même si les modifications continuent
+
+ORDERS_DIR = "commandes_semaines"                   # une partition par semaine ISO de livraison
+ARCHIVE_DIR = os.path.join(ORDERS_DIR, "archive")   # semaines passées, voir archive.py
+NO_DATE_PARTITION = "sans-date"
+
+SEQUENCE_FILE = "sequence_commandes.json"
+MANUAL_ORDER_START = 900000  # plage des commandes manuelles, bien au-delà de la numérotation Shopify
+SEQUENCE_BLOCK = 20          # numéros réservés d'un coup par session
+LOCK_TIMEOUT = 10.0
+STALE_LOCK_AGE = 30.0
+
+
+# === Empreintes ===
+def fingerprint_df(df):
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    h.update("\x1f".join(map(str, df.dtypes)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def fingerprint_bytes(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def fingerprint_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return fingerprint_bytes(f.read())
+
+
+def file_stamp(path):
+    # (mtime_ns, taille) : change à chaque réécriture, par ce processus ou un autre (autre worker, OneDrive, Excel)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# === File d'écriture différée ===
+class WriteBehindQueue:
+    def __init__(self, delay=WRITE_DELAY, max_delay=WRITE_MAX_DELAY):
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = {}    # path -> [données, échéance, première soumission]
+        self._frame_fp = {}   # path -> empreinte du dernier DataFrame soumis
+        self._file_fp = {}    # path -> empreinte du contenu sur disque (ou en attente)
+        self._disk_fp = {}    # path -> empreinte du contenu effectivement sur disque
+        self._disk_stamp = {} # path -> file_stamp du fichier quand _disk_fp a été relevée
+        self._cond = threading.Condition()
+        self.writes = 0
+        self.skipped = 0
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, df, path, immediate=False, **to_csv_kwargs):
+        # Retourne True si une écriture a été planifiée (ou faite), False si rien n'a changé
+        frame_fp = fingerprint_df(df)
+        with self._cond:
+            self._check_disk_locked(path)
+            if self._frame_fp.get(path) == frame_fp and (path in self._pending or path in self._file_fp):
+                self.skipped += 1
+                if immediate and path in self._pending:
+                    self._write_locked(path)
+                return False
+
+        data = df.to_csv(index=False, **to_csv_kwargs).encode("utf-8")
+        data_fp = fingerprint_bytes(data)
+
+        with self._cond:
+            self._frame_fp[path] = frame_fp
+            self._check_disk_locked(path)
+            if path not in self._disk_fp:
+                self._disk_stamp[path] = file_stamp(path)
+                self._disk_fp[path] = fingerprint_file(path)
+            if data_fp == self._disk_fp[path]:
+                # Contenu identique au disque : on annule une éventuelle écriture en attente
+                self._pending.pop(path, None)
+                self._file_fp[path] = data_fp
+                self.skipped += 1
+                return False
+
+            now = time.monotonic()
+            first = self._pending[path][2] if path in self._pending else now
+            due = min(now + self.delay, first + self.max_delay)
+            self._pending[path] = [data, due, first]
+            self._file_fp[path] = data_fp
+            if immediate:
+                self._write_locked(path)
+            else:
+                self._cond.notify()
+        return True
+
+    def _check_disk_locked(self, path):
+        # Fichier réécrit ailleurs depuis notre dernière lecture ou écriture : les empreintes mémorisées
+        # ne décrivent plus le disque, elles sont oubliées (sinon une sauvegarde serait jugée inutile et perdue)
+        if path in self._pending or path not in self._disk_stamp:
+            return
+        if self._disk_stamp[path] != file_stamp(path):
+            for known in (self._frame_fp, self._file_fp, self._disk_fp, self._disk_stamp):
+                known.pop(path, None)
+
+    def pending_bytes(self, path):
+        with self._cond:
+            entry = self._pending.get(path)
+            return entry[0] if entry else None
+
+    def pending_fingerprint(self, path):
+        with self._cond:
+            return self._file_fp.get(path) if path in self._pending else None
+
+    def pending_paths(self):
+        with self._cond:
+            return list(self._pending)
+
+    def flush(self, path=None):
+        with self._cond:
+            for p in [path] if path else list(self._pending):
+                if p in self._pending:
+                    self._write_locked(p)
+
+    def _write_locked(self, path):
+        data = self._pending[path][0]
+        tmp_path = None
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Fichier temporaire propre à cette écriture : plusieurs processus peuvent écrire le même fichier
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Fichier verrouillé (OneDrive, Excel...) : on réessaie plus tard
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._pending[path][1] = time.monotonic() + self.delay
+            return
+        del self._pending[path]
+        self._disk_fp[path] = fingerprint_bytes(data)
+        self._disk_stamp[path] = file_stamp(path)
+        self.writes += 1
+        bump_version(path)  # prévient les autres processus Streamlit
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                next_due = min(entry[1] for entry in self._pending.values())
+                if next_due > now:
+                    self._cond.wait(next_due - now)
+                    continue
+                for path in [p for p, entry in self._pending.items() if entry[1] <= now]:
+                    self._write_locked(path)
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteBehindQueue()
+        return _write_queue
+
+
+# === API utilisée par main.py ===
+def save_csv(df, path, immediate=False, **to_csv_kwargs):
+    return get_write_queue().submit(df, path, immediate=immediate, **to_csv_kwargs)
+
+
+def load_csv(path, **read_csv_kwargs):
+    # Lit la version en attente d'écriture si elle existe, sinon le fichier sur disque
+    pending = get_write_queue().pending_bytes(path)
+    if pending is not None:
+        return pd.read_csv(io.BytesIO(pending), **read_csv_kwargs)
+    if os.path.exists(path):
+        return pd.read_csv(path, **read_csv_kwargs)
+    return pd.DataFrame()
+
+
+def flush_writes(path=None):
+    get_write_queue().flush(path)
+
+
+# === Partitions hebdomadaires des commandes ===
+def week_key(date):
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def current_week_key():
+    return week_key(datetime.today())
+
+
+def delivery_week_keys(plats):
+    dates = extract_delivery_dates(plats)
+    iso = dates.dt.isocalendar()
+    keys = iso["year"].astype("string") + "-W" + iso["week"].astype("string").str.zfill(2)
+    return keys.fillna(NO_DATE_PARTITION)
+
+
+def partition_path(name, key):
+    return os.path.join(_partition_dir(name), f"{key}.csv")
+
+
+def _partition_dir(name):
+    return os.path.join(ORDERS_DIR, name)
+
+
+def list_partitions(name):
+    folder = _partition_dir(name)
+    keys = set()
+    if os.path.isdir(folder):
+        keys.update(f[:-4] for f in os.listdir(folder) if f.endswith(".csv"))
+    for path in get_write_queue().pending_paths():
+        if os.path.dirname(path) == folder:
+            keys.add(os.path.basename(path)[:-4])
+    return sorted(keys)
+
+
+def hot_weeks(name):
+    # Semaine courante, semaines futures et lignes sans date de livraison
+    current = current_week_key()
+    return [k for k in list_partitions(name) if k == NO_DATE_PARTITION or k >= current]
+
+
+def load_orders(name, weeks=None, **read_csv_kwargs):
+    keys = hot_weeks(name) if weeks is None else weeks
+    frames = [load_csv(partition_path(name, key), **read_csv_kwargs) for key in keys]
+    non_empty = [df for df in frames if not df.empty]
+    if non_empty:
+        return pd.concat(non_empty, ignore_index=True)
+    return frames[0] if frames else pd.DataFrame()
+
+
+def file_source(path, versions, **read_csv_kwargs):
+    # (jeton, chargeur) ; le jeton change à chaque écriture : par l'app (version partagée ou écriture en attente)
+    # ou hors de l'app (OneDrive, Excel : date de modification et taille du fichier)
+    token = (versions.get(path, 0), get_write_queue().pending_fingerprint(path), file_stamp(path))
+    return token, lambda: load_csv(path, **read_csv_kwargs)
+
+
+def partition_sources(name, versions, weeks=None):
+    # {chemin: (jeton, chargeur)} pour chaque partition
+    return {
+        partition_path(name, key): file_source(partition_path(name, key), versions)
+        for key in (hot_weeks(name) if weeks is None else weeks)
+    }
+
+
+def save_orders(df, name, scope=None, immediate=False, **to_csv_kwargs):
+    # Écrit chaque semaine dans sa partition. Les semaines de `scope` absentes de df sont vidées.
+    keys = delivery_week_keys(df["Plat"]) if "Plat" in df.columns else pd.Series(NO_DATE_PARTITION, index=df.index)
+    changed = False
+    written = set()
+    for key, part in df.groupby(keys, sort=False):
+        changed |= save_csv(part, partition_path(name, key), immediate=immediate, **to_csv_kwargs)
+        written.add(key)
+    for key in set(scope or []) - written:
+        changed |= save_csv(df.iloc[0:0], partition_path(name, key), immediate=immediate, **to_csv_kwargs)
+    return changed
+
+
+LINE_KEY = ["order_number", "Nom", "source_name", "note", "Plat"]
+
+
+def _line_index(df):
+    return pd.MultiIndex.from_arrays(
+        [pd.to_numeric(df["order_number"], errors="coerce").to_numpy("float64")]
+        + [df[col].fillna("").astype(str).to_numpy() if col in df.columns else [""] * len(df) for col in LINE_KEY[1:]]
+    )
+
+
+def upsert_lines(changes, name, immediate=False, **to_csv_kwargs):
+    # Applique des quantités par clé de ligne (0 = suppression) en ne relisant que les semaines concernées.
+    # Les lignes en double d'une même clé sont fusionnées dans la première.
+    changed = False
+    if changes.empty:
+        return changed
+    for key, part in changes.groupby(delivery_week_keys(changes["Plat"]), sort=False):
+        path = partition_path(name, key)
+        existing = load_csv(path)
+        if existing.empty and not len(existing.columns):
+            existing = part.iloc[0:0]
+        part_keys = _line_index(part)
+        last = ~part_keys.duplicated(keep="last")
+        new_qty = pd.Series(part["quantity"].to_numpy()[last], index=part_keys[last])
+
+        existing_keys = _line_index(existing)
+        matched = existing_keys.isin(new_qty.index)
+        first = matched & ~existing_keys.duplicated()
+        quantity = pd.Series(new_qty.reindex(existing_keys).to_numpy(), index=existing.index)
+        existing = existing.assign(quantity=quantity.where(first, existing["quantity"]))
+        existing = existing[~matched | (first & (quantity > 0))]
+
+        added = part[last & ~part_keys.isin(existing_keys) & (part["quantity"] > 0).to_numpy()]
+        result = pd.concat([existing, added], ignore_index=True)
+        changed |= save_csv(result, path, immediate=immediate, **to_csv_kwargs)
+    return changed
+
+
+def route_lines(changes, names, default):
+    # Fichier de destination de chaque modification : celui qui contient déjà la clé de ligne (une commande
+    # manuelle peut avoir la source "web"), sinon `default` (nom de fichier par ligne) pour une ligne nouvelle.
+    # Clé présente dans plusieurs fichiers : la quantité va au premier, la ligne est supprimée des autres.
+    # Colonne move_id (optionnelle) : ligne déplacée vers une nouvelle clé, qui suit le fichier de l'ancienne.
+    # Retourne {nom: modifications à passer à upsert_lines}
+    moves = changes["move_id"].to_numpy() if "move_id" in changes.columns else None
+    changes = changes.drop(columns="move_id", errors="ignore")
+    keys = _line_index(changes)
+    weeks = delivery_week_keys(changes["Plat"]).to_numpy()
+    found = {name: np.zeros(len(changes), dtype=bool) for name in names}
+    for week in pd.unique(weeks):
+        in_week = weeks == week
+        for name in names:
+            existing = load_csv(partition_path(name, week))
+            if not existing.empty:
+                found[name][in_week] = keys[in_week].isin(_line_index(existing))
+    owner = np.asarray(default, dtype=object).copy()
+    assigned = np.zeros(len(changes), dtype=bool)
+    for name in names:
+        first = found[name] & ~assigned
+        owner[first] = name
+        assigned |= first
+    if moves is not None:
+        linked = pd.notna(moves)
+        origin = dict(zip(moves[linked & assigned], owner[linked & assigned]))
+        follow = linked & ~assigned & pd.Series(moves).isin(origin.keys()).to_numpy()
+        owner[follow] = [origin[move] for move in moves[follow]]
+    return {name: pd.concat([changes[owner == name], changes[found[name] & (owner != name)].assign(quantity=0)],
+                            ignore_index=True)
+            for name in names}
+
+
+def migrate_flat_orders(name, flat_path, **to_csv_kwargs):
+    # Découpe une seule fois l'ancien fichier plat (commandes.csv...) en partitions
+    if os.path.isdir(_partition_dir(name)) or not os.path.exists(flat_path):
+        return False
+    os.makedirs(_partition_dir(name), exist_ok=True)
+    save_orders(pd.read_csv(flat_path), name, immediate=True, **to_csv_kwargs)
+    return True
+
+
+# === Séquence des numéros de commande manuels ===
+class FileLock:
+    # Verrou inter-processus basé sur la création exclusive d'un fichier .lock
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.lock_path = f"{path}.lock"
+        self.timeout = timeout
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK_AGE:
+                        os.remove(self.lock_path)  # verrou abandonné par un processus planté
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Verrou {self.lock_path} indisponible")
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+
+_sequence_lock = threading.Lock()
+
+
+def reserve_order_numbers(count, path=SEQUENCE_FILE):
+    # Réserve `count` numéros consécutifs ; retourne (premier, dernier + 1)
+    with _sequence_lock, FileLock(path):
+        next_number = MANUAL_ORDER_START
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                next_number = max(next_number, int(json.load(f).get("next", next_number)))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"next": next_number + count}, f)
+        os.replace(tmp_path, path)
+    return next_number, next_number + count
+
+
+class OrderNumberAllocator:
+    # Un par session : distribue les numéros d'un bloc réservé, sans relire les commandes
+    def __init__(self, block_size=SEQUENCE_BLOCK, path=SEQUENCE_FILE):
+        self.block_size = block_size
+        self.path = path
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, count=1):
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    self._next, self._end = reserve_order_numbers(max(self.block_size, count - len(numbers)), self.path)
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return numbers
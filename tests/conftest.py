@@ -0,0 +1,18 @@
+# Tests des modules de traitement (sans Streamlit) : python -m pytest
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shared_store  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Chaque test travaille dans un dossier vide (partitions de commandes, cache partagé SQLite)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(shared_store, "_local", threading.local())
+    return tmp_path
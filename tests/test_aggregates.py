@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import MaterializedAggregates, order_sources
+from archive import compact_orders
+from storage import list_partitions, partition_path, save_orders
+from transforms import JOURS_SEMAINE, build_product_dim
+
+
+def dish(day, name):
+    return f"{JOURS_SEMAINE[day.weekday()]} {day:%d/%m}: {name}"
+
+
+def week_start(weeks_ago):
+    today = pd.Timestamp.today().normalize()
+    return today - pd.Timedelta(days=today.weekday() + 7 * weeks_ago)
+
+
+def week_lines(weeks_ago, first_order, source):
+    # Prix entiers : sommes exactes, l'ordre des agrégats ne dépend pas des arrondis
+    day = week_start(weeks_ago) + pd.Timedelta(days=1)
+    return pd.DataFrame({
+        "order_number": [first_order, first_order, first_order + 1],
+        "Nom": ["Anne", "Anne", "Bob" if weeks_ago % 2 else "Zoé"],
+        "Plat": [dish(day, "Gratin"), dish(day, "Soupe"), dish(day, "Gratin")],
+        "quantity": [2, 1, weeks_ago + 1],
+        # Prix manquant : complété par le catalogue (partitions) ou à la compaction (archive)
+        "price": [12.0, np.nan, 11.0],
+        "source_name": source,
+        "note": "",
+    })
+
+
+def catalogue(titles):
+    return build_product_dim(pd.DataFrame({"id": range(len(titles)), "title": titles, "price": 8.0}))
+
+
+def assert_same_aggregates(incremental, sources, customers):
+    full = MaterializedAggregates()
+    full.refresh(sources)
+    for view in ("by_day_dish", "by_source", "by_customer"):
+        pd.testing.assert_frame_equal(getattr(incremental, view)(), getattr(full, view)())
+    pd.testing.assert_frame_equal(incremental.by_route(customers), full.by_route(customers))
+
+
+def test_incremental_refresh_matches_a_full_recompute():
+    lines = {"commandes": pd.concat([week_lines(w, 10 * w, "web") for w in (3, 2, 1, 0)], ignore_index=True),
+             "commandes_additionnelles": pd.concat([week_lines(w, 900000 + w, "non web") for w in (2, 0)],
+                                                   ignore_index=True)}
+    for name, df in lines.items():
+        save_orders(df, name, immediate=True)
+    titles = sorted(set(pd.concat(lines.values())["Plat"]))
+    catalog = ("v1", lambda dim=catalogue(titles): dim)
+    customers = ("v1", lambda: pd.DataFrame({"Nom": ["Anne", "Bob"], "Itinéraire": [1.0, 2.0]}))
+
+    aggregates = MaterializedAggregates()
+    aggregates.refresh(order_sources({}, catalog))
+    assert_same_aggregates(aggregates, order_sources({}, catalog), customers)
+
+    # Une partition modifiée, une autre supprimée : seules ces sources sont relues
+    edited = lines["commandes"].assign(quantity=lines["commandes"]["quantity"] * 10)
+    save_orders(edited, "commandes", immediate=True)
+    removed = list_partitions("commandes_additionnelles")[0]
+    os.remove(partition_path("commandes_additionnelles", removed))
+    versions = {partition_path("commandes", week): 1 for week in list_partitions("commandes")}
+    assert aggregates.refresh(order_sources(versions, catalog)) > 0
+    assert_same_aggregates(aggregates, order_sources(versions, catalog), customers)
+    assert aggregates.by_source().set_index("source_name")["quantity"].to_dict() == {
+        "web": edited["quantity"].sum(), "non web": 4.0}
+
+    # Compaction : les semaines passées quittent les partitions pour les blocs de l'archive
+    prices = dict.fromkeys(titles, 8.0)
+    assert compact_orders("commandes", prices) == 3
+    before = aggregates.by_day_dish()
+    aggregates.refresh(order_sources(versions, catalog))
+    assert_same_aggregates(aggregates, order_sources(versions, catalog), customers)
+    pd.testing.assert_frame_equal(aggregates.by_day_dish(), before)
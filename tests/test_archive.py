@@ -0,0 +1,97 @@
+import os
+
+import pandas as pd
+import pytest
+
+from archive import append_to_archive, compact_orders, read_index, scan_archive
+from storage import FileLock, current_week_key, list_partitions, partition_path, save_orders
+from transforms import JOURS_SEMAINE
+
+
+def dish(day, name="Plat"):
+    return f"{JOURS_SEMAINE[day.weekday()]} {day:%d/%m}: {name}"
+
+
+def orders(days):
+    return pd.DataFrame({
+        "order_number": range(1, len(days) + 1),
+        "Plat": [dish(d) for d in days],
+        "Nom": "Client",
+        "quantity": 1,
+        "price": 10.0,
+        "source_name": "web",
+        "note": "",
+    })
+
+
+def week_start(weeks_ago):
+    today = pd.Timestamp.today().normalize()
+    return today - pd.Timedelta(days=today.weekday() + 7 * weeks_ago)
+
+
+def test_compaction_moves_past_weeks_once():
+    days = [week_start(w) + pd.Timedelta(days=1) for w in (3, 2, 1, 0)]
+    save_orders(orders(days), "commandes", immediate=True)
+    assert compact_orders("commandes") == 3
+    assert list_partitions("commandes") == [current_week_key()]
+    archived, _ = scan_archive("commandes")
+    assert sorted(archived["order_number"]) == [1, 2, 3]
+    # Deuxième passage (autre processus, partitions déjà archivées) : rien n'est archivé deux fois
+    assert compact_orders("commandes") == 0
+    assert len(scan_archive("commandes")[0]) == 3
+
+
+def test_compaction_resumes_after_a_crash_without_archiving_twice(monkeypatch):
+    days = [week_start(w) + pd.Timedelta(days=1) for w in (2, 1)]
+    save_orders(orders(days), "commandes", immediate=True)
+    partitions = {partition_path("commandes", key) for key in list_partitions("commandes")}
+    remove = os.remove
+
+    def crash(path):
+        # Arrêt entre l'écriture des blocs et la suppression des partitions
+        if path in partitions:
+            raise KeyboardInterrupt
+        remove(path)
+
+    with monkeypatch.context() as patch, pytest.raises(KeyboardInterrupt):
+        patch.setattr(os, "remove", crash)
+        compact_orders("commandes")
+    assert len(scan_archive("commandes")[0]) == 2
+    assert compact_orders("commandes") == 2
+    assert list_partitions("commandes") == []
+    assert len(scan_archive("commandes")[0]) == 2
+
+    # Semaine passée réécrite après sa compaction (commande corrigée) : archivée à nouveau
+    late = orders([days[0]]).assign(order_number=7)
+    save_orders(late, "commandes", immediate=True)
+    assert compact_orders("commandes") == 1
+    assert sorted(scan_archive("commandes")[0]["order_number"]) == [1, 2, 7]
+
+
+def test_compaction_skips_while_another_process_compacts():
+    save_orders(orders([week_start(2)]), "commandes", immediate=True)
+    os.makedirs(os.path.join("commandes_semaines", "archive", "commandes"), exist_ok=True)
+    with FileLock(os.path.join("commandes_semaines", "archive", "commandes")):
+        assert compact_orders("commandes") == 0
+    assert compact_orders("commandes") == 1
+    assert len(scan_archive("commandes")[0]) == 1
+
+
+def test_scan_prunes_blocks_outside_zone_maps():
+    days = [week_start(10) + pd.Timedelta(days=i) for i in range(40)]
+    df = orders(days)
+    df["date_livraison"] = days
+    append_to_archive(df, "commandes", block_rows=10)
+    assert len(read_index("commandes")) == 4
+
+    rows, stats = scan_archive("commandes", date_from=days[12].date(), date_to=days[15].date())
+    assert sorted(rows["order_number"]) == [13, 14, 15, 16]
+    assert stats == {"blocs_lus": 1, "blocs_total": 4}
+
+    rows, stats = scan_archive("commandes", order_range=(35, None))
+    assert sorted(rows["order_number"]) == list(range(35, 41))
+    assert stats["blocs_lus"] == 1
+
+    rows, stats = scan_archive("commandes", plat=f"{days[25]:%d/%m}")
+    assert rows["order_number"].tolist() == [26]
+    assert stats["blocs_lus"] == 1
@@ -0,0 +1,28 @@
+import gc
+
+import pandas as pd
+
+from datasets import DatasetRegistry
+
+
+def test_lease_frames_are_isolated_from_the_shared_version():
+    registry = DatasetRegistry()
+    lease = registry.acquire("commandes", 1, lambda: pd.DataFrame({"name": ["a", "b"], "quantity": [1, 2]}))
+    frame = lease.frame.rename(columns={"name": "Plat"})
+    frame.loc[0, "quantity"] = 10
+    other = lease.frame
+    other.loc[1, "quantity"] = 20
+    other["quantity"] = other["quantity"] * 2
+    assert registry.acquire("commandes", 1, lambda: None).frame.values.tolist() == [["a", 1], ["b", 2]]
+
+
+def test_registry_keeps_one_frame_per_version():
+    registry = DatasetRegistry()
+    first = registry.acquire("commandes", 1, lambda: pd.DataFrame({"v": [1]}))
+    assert registry.acquire("commandes", 1, lambda: pd.DataFrame({"v": [9]})).frame["v"].tolist() == [1]
+    registry.acquire("commandes", 2, lambda: pd.DataFrame({"v": [2]}))
+    # L'ancienne version reste tant qu'un bail la tient
+    assert set(registry.stats()) == {("commandes", 1), ("commandes", 2)}
+    del first
+    gc.collect()
+    assert set(registry.stats()) == {("commandes", 2)}
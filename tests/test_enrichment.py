@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from enrichment import OrderEnricher
+from transforms import build_product_dim
+
+CLIENT_COLUMNS = ["email", "telephone", "adresse", "ville", "Itinéraire"]
+
+
+def clients():
+    return pd.DataFrame({
+        "Nom": ["Anne", "Bob", "Zoé"],
+        "Itinéraire": ["Nord", "Sud", np.nan],
+        "email": ["anne@a.fr", np.nan, "zoe@z.fr"],
+        "telephone": ["0601", "0602", "0603"],
+        "adresse": ["1 rue A", "2 rue B", "3 rue C"],
+        "ville": ["Lyon", "Lyon", "Bron"],
+    })
+
+
+def catalogue():
+    return pd.DataFrame({
+        "id": [11, 12, 13],
+        "title": ["Lundi 05/01: Gratin", "Mardi 06/01: Soupe", "Jeudi 08/01: Tarte"],
+        "price": [12.5, 8.0, np.nan],
+    })
+
+
+def orders():
+    # Client absent de la fiche, prix explicites ou manquants, plat absent du catalogue ou sans prix
+    return pd.DataFrame({
+        "order_number": [1, 1, 2, 3, 4, 5],
+        "Nom": ["Anne", "Anne", "Bob", "Inconnu", "Zoé", "Bob"],
+        "Plat": ["Lundi 05/01: Gratin", "Mardi 06/01: Soupe", "Lundi 05/01: Gratin", "Mardi 06/01: Soupe",
+                 "Jeudi 08/01: Tarte", "Plat retiré"],
+        "quantity": [2, 1, 3, np.nan, 1, 2],
+        "price": [np.nan, 7.0, np.nan, np.nan, np.nan, 4.0],
+        "source_name": ["web", "web", "web", "non web", "web", "web"],
+        "note": ["", "", "sonner", "", "", ""],
+        "email": [np.nan, np.nan, "bob@b.fr", "x@y.fr", np.nan, np.nan],
+    })
+
+
+def legacy_synthese(df_all, clients_info, produits_prices):
+    # Ancien calcul de la page Synthèse : merge sur le nom, fusion _x/_y, prix du catalogue par titre
+    final_df = df_all.merge(clients_info, on="Nom", how="left")
+    for col in CLIENT_COLUMNS:
+        col_x, col_y = f"{col}_x", f"{col}_y"
+        if col_x in final_df.columns and col_y in final_df.columns:
+            final_df[col] = final_df[col_x].combine_first(final_df[col_y])
+            final_df.drop(columns=[col_x, col_y], inplace=True)
+    prix_map = produits_prices.set_index("title")["price"].to_dict()
+    final_df["price"] = final_df["price"].fillna(final_df["Plat"].map(prix_map).astype(float))
+    final_df["total"] = final_df["price"] * final_df["quantity"].fillna(0)
+    final_order = ["order_number", "Nom", "Plat", "quantity", "price", "total", "source_name", "note",
+                   "Itinéraire", "email", "telephone", "adresse", "ville"]
+    return final_df[[col for col in final_order if col in final_df.columns]]
+
+
+def test_enrich_matches_the_merge_and_combine_first_synthese():
+    dim = build_product_dim(catalogue(), reference="2026-01-01")
+    enricher = OrderEnricher()
+    result = enricher.enrich(orders(), ("v1", clients), ("v1", lambda: dim))
+    expected = legacy_synthese(orders(), clients(), catalogue())
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_enrich_without_price_column_takes_the_catalogue_price():
+    dim = build_product_dim(catalogue(), reference="2026-01-01")
+    result = OrderEnricher().enrich(orders().drop(columns="price"), None, ("v1", lambda: dim))
+    assert result["price"].tolist()[:3] == [12.5, 8.0, 12.5]
+    assert result["total"].tolist()[:3] == [25.0, 8.0, 37.5]
+    assert "Itinéraire" not in result.columns
+
+
+def test_dropdown_options_follow_the_source_version():
+    dim = build_product_dim(catalogue(), reference="2026-01-01")
+    enricher = OrderEnricher()
+    since = pd.Timestamp("2026-01-06")
+    assert enricher.dish_options(("v1", lambda: dim), since) == sorted(
+        dim.loc[dim["date_livraison"] >= since, "title"].tolist())
+    assert enricher.customer_options(("v1", clients)) == sorted(clients()["Nom"])
+    # Même version : options reprises telles quelles ; nouvelle version : recalculées
+    assert enricher.customer_options(("v1", lambda: clients().iloc[:1])) == ["Anne", "Bob", "Zoé"]
+    assert enricher.customer_options(("v2", lambda: clients().iloc[:1])) == ["Anne"]
@@ -0,0 +1,39 @@
+import re
+
+from production import PDF_TEXT_WIDTH, _pdf_width, text_pdf
+
+
+def pdf_lines(pdf):
+    return [line.decode("cp1252") for line in re.findall(rb"\((.*?)\) Tj T\*", pdf)]
+
+
+def test_text_pdf_wraps_lines_to_the_page_width():
+    titre = "    12 x " + "Blanquette de veau à l'ancienne, riz basmati et petits légumes du marché " * 3
+    lines = pdf_lines(text_pdf("Plan", ["Lundi 05/01 - 12 portions", titre, "x" * 200]))
+    assert len(lines) > 3
+    assert all(_pdf_width(line, 10) <= PDF_TEXT_WIDTH for line in lines)
+    assert " ".join(part.strip() for part in lines[1:-2]).startswith("12 x Blanquette de veau à l'ancienne")
+    assert "".join(part.strip() for part in lines if set(part.strip()) == {"x"}) == "x" * 200
+
+
+def test_text_pdf_never_replaces_characters_silently():
+    lines = pdf_lines(text_pdf("Plan", ["Crème brûlée", "Saumon ōmi", "Chili 🔥"]))
+    assert lines == ["Crème brûlée", "Saumon omi", "Chili <U+1F525>"]
+
+
+def test_production_plan_takes_course_and_dish_from_the_catalogue_codes():
+    import pandas as pd
+
+    from enrichment import _catalog_table
+    from production import UNKNOWN_COURSE, production_plan
+    from transforms import DISHES, build_product_dim
+
+    dim = build_product_dim(pd.DataFrame({"id": [1, 2], "title": ["Noël : Entrée: Foie gras", "Jeudi 24/12: Mijoté"],
+                                          "price": [18, 12]}), reference="2025-12-01")
+    plats = pd.Series(["Noël : Entrée: Foie gras", "Jeudi 24/12: Mijoté", "Jeudi 24/12: Hors catalogue"])
+    by_day_dish = pd.DataFrame({"date_livraison": pd.to_datetime(["2025-12-24"] * 3), "Plat": plats,
+                                "plat_code": DISHES.encode(plats).to_numpy(), "quantity": [3.0, 5.0, 1.0]})
+    plan = production_plan(by_day_dish, "2025-12-22", "2025-12-28", _catalog_table(dim))
+    assert plan[["type", "plat", "quantity"]].values.tolist() == [
+        ["Entrée", "Foie gras", 3], [UNKNOWN_COURSE, "Hors catalogue", 1], [UNKNOWN_COURSE, "Mijoté", 5]]
+    assert plan["jour"].unique().tolist() == ["Mercredi 24/12"]
@@ -0,0 +1,149 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shared_store import (cached_fetch, get_version, invalidate, refresh_status, shared_get, shared_put,
+                          single_flight, sync_shared_caches, warm_value)
+
+
+def test_single_flight_runs_once_for_concurrent_callers():
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"orders": 3}
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(single_flight, "k", slow)
+        started.wait(5)
+        followers = [pool.submit(single_flight, "k", slow) for _ in range(3)]
+        time.sleep(0.2)   # les suivants attendent l'appel en cours
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_single_flight_shares_the_error_and_keeps_nothing():
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("Shopify indisponible")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(single_flight, "k", failing)
+        started.wait(5)
+        follower = pool.submit(single_flight, "k", failing)
+        time.sleep(0.2)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="indisponible"):
+                future.result()
+    # Appel terminé : le suivant s'exécute de nouveau
+    assert single_flight("k", lambda: "ok") == "ok"
+
+
+def test_warm_value_rebuilds_on_new_stamp_from_the_previous_value():
+    builds = []
+
+    def build(previous):
+        builds.append(previous)
+        return (previous or 0) + 1
+
+    assert warm_value("index_test", "v1", build) == 1
+    assert warm_value("index_test", "v2", build) == 2
+    assert builds == [None, 1]
+
+
+def test_warm_value_serves_the_persisted_value_and_revalidates_in_background(monkeypatch):
+    import shared_store
+
+    assert warm_value("fiches_test", "v1", lambda previous: "lu au démarrage") == "lu au démarrage"
+    # Nouveau processus : même tampon, valeur servie depuis SQLite, revérifiée en arrière-plan une fois
+    monkeypatch.setattr(shared_store, "_validated", {})
+    revalidated = threading.Event()
+
+    def rebuild(previous):
+        revalidated.set()
+        return "relu"
+
+    assert warm_value("fiches_test", "v1", rebuild) == "lu au démarrage"
+    assert revalidated.wait(5)
+    for _ in range(50):
+        if warm_value("fiches_test", "v1", lambda previous: "jamais") == "relu":
+            break
+        time.sleep(0.05)
+    assert warm_value("fiches_test", "v1", lambda previous: "jamais") == "relu"
+
+
+def wait_refresh(key):
+    for _ in range(100):
+        if not refresh_status(key)[0]:
+            return
+        time.sleep(0.02)
+
+
+def test_cached_fetch_serves_fresh_values_without_fetching():
+    calls = []
+    fetch = lambda: calls.append(1) or len(calls)
+    value, fetched_at = cached_fetch("ttl_test", fetch, ttl=60)
+    assert value == 1
+    assert cached_fetch("ttl_test", fetch, ttl=60) == (1, fetched_at)
+    assert len(calls) == 1
+
+
+def test_cached_fetch_serves_stale_value_while_refreshing():
+    shared_put("stale_test", "ancien", fetched_at=time.time() - 120)
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        return "nouveau"
+
+    assert cached_fetch("stale_test", fetch, ttl=60, max_stale=3600)[0] == "ancien"
+    assert refresh_status("stale_test")[0]
+    release.set()
+    wait_refresh("stale_test")
+    assert cached_fetch("stale_test", fetch, ttl=60)[0] == "nouveau"
+
+    # Trop ancienne (au-delà de max_stale) : récupérée tout de suite
+    shared_put("stale_test", "ancien", fetched_at=time.time() - 7200)
+    assert cached_fetch("stale_test", lambda: "immédiat", ttl=60, max_stale=3600)[0] == "immédiat"
+
+
+def test_invalidate_forces_a_new_fetch_and_bumps_the_version():
+    cached_fetch("invalidate_test", lambda: "v1", ttl=60)
+    version = get_version("invalidate_test")
+    assert invalidate("invalidate_test") == version + 1
+    assert sync_shared_caches()["invalidate_test"] == version + 1
+    assert cached_fetch("invalidate_test", lambda: "v2", ttl=60)[0] == "v2"
+
+
+def test_errors_are_never_cached_and_failed_refreshes_back_off():
+    def down():
+        raise RuntimeError("429 Too Many Requests")
+
+    with pytest.raises(RuntimeError):
+        cached_fetch("error_test", down, ttl=60)
+    assert shared_get("error_test") is None
+
+    shared_put("error_test", "ancien", fetched_at=time.time() - 120)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise RuntimeError("Shopify indisponible")
+
+    for _ in range(10):
+        assert cached_fetch("error_test", failing, ttl=60, max_stale=3600)[0] == "ancien"
+        wait_refresh("error_test")
+    assert len(calls) == 1
+    assert refresh_status("error_test")[1][0] == "Shopify indisponible"
+    assert shared_get("error_test")[0] == "ancien"
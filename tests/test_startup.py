@@ -0,0 +1,35 @@
+import pytest
+
+import startup
+from startup import StartupTasks
+
+
+def test_failed_task_is_retried_only_after_the_delay(monkeypatch):
+    calls = []
+
+    def shopify():
+        calls.append(1)
+        raise RuntimeError("Shopify indisponible")
+
+    tasks = StartupTasks(max_workers=1)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            tasks.start("commandes Shopify", shopify, token=1).result()
+    assert len(calls) == 1
+
+    # Nouvelle version demandée (rafraîchissement explicite) : relancée tout de suite
+    with pytest.raises(RuntimeError):
+        tasks.start("commandes Shopify", shopify, token=2).result()
+    assert len(calls) == 2
+
+    monkeypatch.setattr(startup, "RETRY_DELAY", 0)
+    assert tasks.start("commandes Shopify", lambda: "ok", token=2).result() == "ok"
+
+
+def test_task_receives_results_of_its_dependencies():
+    tasks = StartupTasks(max_workers=2)
+    tasks.start("Clients.csv", lambda: ["Anne"], token=1)
+    future = tasks.start("fiche clients indexée", lambda clients: len(clients), after=["Clients.csv"], token=1)
+    assert future.result() == 1
+    assert tasks.token("fiche clients indexée") == 1
+    assert tasks.start("fiche clients indexée", lambda clients: 0, after=["Clients.csv"], token=1) is future
@@ -0,0 +1,114 @@
+import os
+
+import pandas as pd
+
+from storage import WriteBehindQueue
+
+
+def test_write_queue_skips_unchanged_content():
+    queue = WriteBehindQueue()
+    df = pd.DataFrame({"v": [1, 2]})
+    assert queue.submit(df, "f.csv", immediate=True)
+    assert not queue.submit(df.copy(), "f.csv", immediate=True)
+    assert queue.writes == 1
+
+
+def test_write_queue_sees_writes_from_another_process():
+    # Deux files = deux processus : la seconde réécrit le fichier, la première ne doit pas juger sa sauvegarde inutile
+    first, other = WriteBehindQueue(), WriteBehindQueue()
+    first.submit(pd.DataFrame({"v": [1]}), "f.csv", immediate=True)
+    other.submit(pd.DataFrame({"v": [2]}), "f.csv", immediate=True)
+    assert first.submit(pd.DataFrame({"v": [1]}), "f.csv", immediate=True)
+    assert pd.read_csv("f.csv")["v"].tolist() == [1]
+    assert not [name for name in os.listdir(".") if name.endswith(".tmp")]
+
+
+def test_order_numbers_are_unique_across_sessions_and_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from storage import MANUAL_ORDER_START, OrderNumberAllocator
+
+    sessions = [OrderNumberAllocator(block_size=5) for _ in range(4)]
+    with ThreadPoolExecutor(8) as pool:
+        blocks = list(pool.map(lambda i: sessions[i % 4].allocate(3), range(40)))
+    numbers = [n for block in blocks for n in block]
+    assert len(numbers) == len(set(numbers)) == 120
+    assert min(numbers) >= MANUAL_ORDER_START
+
+
+def test_order_number_sequence_survives_restart():
+    from storage import OrderNumberAllocator
+
+    first = OrderNumberAllocator(block_size=10).allocate(2)
+    # Nouveau processus : le bloc réservé par le premier n'est jamais redistribué
+    second = OrderNumberAllocator(block_size=10).allocate(2)
+    assert second[0] >= first[0] + 10
+
+
+def test_file_source_token_changes_on_external_edit():
+    from storage import file_source
+
+    pd.DataFrame({"Nom": ["A"]}).to_csv("Clients.csv", index=False)
+    token, _ = file_source("Clients.csv", {})
+    # Modification hors de l'app (Excel, OneDrive) : pas de version partagée publiée
+    pd.DataFrame({"Nom": ["A", "B"]}).to_csv("Clients.csv", index=False)
+    new_token, loader = file_source("Clients.csv", {})
+    assert new_token != token
+    assert loader()["Nom"].tolist() == ["A", "B"]
+
+
+def order_line(order_number, nom, source, plat, quantity):
+    return {"order_number": order_number, "Nom": nom, "source_name": source, "note": "", "Plat": plat, "quantity": quantity}
+
+
+def test_upsert_lines_updates_merges_and_deletes_by_line_key():
+    from storage import list_partitions, load_orders, save_orders, upsert_lines
+
+    plat = "Lundi 05/01: Gratin"
+    save_orders(pd.DataFrame([order_line(1, "Anne", "web", plat, 2), order_line(1, "Anne", "web", plat, 1),
+                              order_line(2, "Bob", "web", plat, 4)]), "commandes", immediate=True)
+    changes = pd.DataFrame([order_line(1, "Anne", "web", plat, 5), order_line(2, "Bob", "web", plat, 0),
+                            order_line(3, "Zoé", "web", plat, 1)])
+    assert upsert_lines(changes, "commandes", immediate=True)
+    result = load_orders("commandes", list_partitions("commandes")).sort_values("order_number")
+    # Doublon fusionné dans la première ligne, quantité 0 = suppression, clé inconnue = ajout
+    assert result[["order_number", "quantity"]].values.tolist() == [[1, 5], [3, 1]]
+
+
+def test_route_lines_sends_changes_to_the_file_holding_the_line():
+    from storage import list_partitions, load_orders, route_lines, save_orders, upsert_lines
+
+    plat = "Lundi 05/01: Gratin"
+    names = ["commandes", "commandes_additionnelles"]
+    save_orders(pd.DataFrame([order_line(1, "Anne", "web", plat, 2)]), "commandes", immediate=True)
+    # Commande manuelle saisie avec la source "web", et une ligne présente dans les deux fichiers
+    save_orders(pd.DataFrame([order_line(900001, "Bob", "web", plat, 3), order_line(1, "Anne", "web", plat, 1)]),
+                "commandes_additionnelles", immediate=True)
+    changes = pd.DataFrame([order_line(900001, "Bob", "web", plat, 4), order_line(1, "Anne", "web", plat, 6),
+                            order_line(900002, "Zoé", "web", plat, 1)])
+    routes = route_lines(changes, names, ["commandes"] * len(changes))
+    for name in names:
+        upsert_lines(routes[name], name, immediate=True)
+
+    web, manuel = (load_orders(name, list_partitions(name)) for name in names)
+    assert sorted(web[["order_number", "quantity"]].values.tolist()) == [[1, 6], [900002, 1]]
+    assert manuel[["order_number", "quantity"]].values.tolist() == [[900001, 4]]
+
+
+def test_route_lines_keeps_moved_lines_in_the_file_of_the_old_key():
+    from storage import list_partitions, load_orders, route_lines, save_orders, upsert_lines
+
+    plat = "Lundi 05/01: Gratin"
+    names = ["commandes", "commandes_additionnelles"]
+    save_orders(pd.DataFrame([order_line(900001, "Bob", "web", plat, 3)]), "commandes_additionnelles", immediate=True)
+    # Commande manuelle "web" renommée : la nouvelle clé n'existe nulle part, elle suit l'ancienne
+    changes = pd.DataFrame([order_line(900001, "Bob", "web", plat, 0), order_line(900001, "Bea", "web", plat, 3)])
+    changes["move_id"] = [7, 7]
+    routes = route_lines(changes, names, ["commandes"] * len(changes))
+    assert "move_id" in changes.columns and routes["commandes"].empty
+    for name in names:
+        upsert_lines(routes[name], name, immediate=True)
+
+    manuel = load_orders("commandes_additionnelles", list_partitions("commandes_additionnelles"))
+    assert manuel[["order_number", "Nom", "quantity"]].values.tolist() == [[900001, "Bea", 3]]
+    assert "move_id" not in manuel.columns
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+import transforms
+from transforms import (PIVOT_INDEX, MaterializedPivot, apply_overlay, build_product_dim, empty_overlay,
+                        extract_delivery_dates, fold_editor_state, pivot_edit_changes, pivot_orders, product_positions,
+                        take_from_dim, unpivot_orders)
+
+
+def order_lines():
+    # Noms choisis pour que l'ordre d'apparition (codes clients) diffère de l'ordre alphabétique
+    return pd.DataFrame({
+        "order_number": [2, 1, 1, 1, 3, 2],
+        "Nom": ["Zoé", "Yves", "Anne", "Yves", "Bob", "Zoé"],
+        "source_name": ["web", "web", "web", "web", "non web", "web"],
+        "note": ["", "", "", "", "livrer tôt", ""],
+        "Plat": ["Lundi 05/01: B", "Lundi 05/01: A", "Lundi 05/01: A", "Lundi 05/01: B", "Lundi 05/01: A", "Lundi 05/01: B"],
+        "quantity": [1, 2, 3, 4, 5, 6],
+    })
+
+
+def test_pivot_orders_matches_pivot_table():
+    lines = order_lines()
+    expected = lines.pivot_table(index=PIVOT_INDEX, columns="Plat", values="quantity",
+                                 aggfunc="sum", fill_value=0).reset_index()
+    result = pivot_orders(lines)
+    assert result[PIVOT_INDEX].astype(str).values.tolist() == expected[PIVOT_INDEX].astype(str).values.tolist()
+    plats = [col for col in expected.columns if col not in PIVOT_INDEX]
+    assert list(result.columns) == PIVOT_INDEX + plats
+    np.testing.assert_array_equal(result[plats].to_numpy(), expected[plats].to_numpy())
+
+
+def test_unpivot_orders_returns_the_lines_of_the_pivot():
+    # Doublons de clé (sommés par le pivot), quantités 0 et NaN (cellules vides, sans ligne au retour)
+    extra = pd.DataFrame({"order_number": [4, 4, 1, 2], "Nom": ["Eve", "Eve", "Anne", "Zoé"],
+                          "source_name": ["web"] * 4, "note": [""] * 4,
+                          "Plat": ["Lundi 05/01: A", "Lundi 05/01: B", "Lundi 05/01: B", "Lundi 05/01: A"],
+                          "quantity": [0, np.nan, 0, 1]})
+    lines = pd.concat([order_lines(), extra], ignore_index=True)
+    expected = lines[lines["quantity"].fillna(0) != 0].groupby(PIVOT_INDEX + ["Plat"], as_index=False)["quantity"].sum()
+    result = unpivot_orders(pivot_orders(lines))
+    assert result["quantity"].dtype == "int64"
+    columns = PIVOT_INDEX + ["Plat", "quantity"]
+    assert sorted(result[columns].values.tolist()) == sorted(expected[columns].astype({"quantity": int}).values.tolist())
+
+
+def week_lines(week, n_orders):
+    return pd.DataFrame({
+        "order_number": np.repeat(np.arange(n_orders) + week * 1000, 2),
+        "Nom": np.repeat([f"Client {week}-{i}" for i in range(n_orders)], 2),
+        "source_name": "web",
+        "note": "",
+        "Plat": [f"Lundi 0{week}/01: {plat}" for _ in range(n_orders) for plat in ("A", "B")],
+        "quantity": 1,
+    })
+
+
+def test_materialized_pivot_refresh_rereads_changed_sources_only():
+    loads = []
+
+    def source(frame):
+        def load():
+            loads.append(1)
+            return frame
+        return load
+
+    weeks = {week: week_lines(week, 3) for week in (1, 2)}
+    pivot = MaterializedPivot()
+    pivot.refresh({week: (1, source(frame)) for week, frame in weeks.items()})
+    assert len(loads) == 2
+
+    weeks[2] = pd.concat([weeks[2], week_lines(2, 4).tail(2)], ignore_index=True)
+    pivot.refresh({1: (1, source(weeks[1])), 2: (2, source(weeks[2]))})
+    assert len(loads) == 3
+
+    expected = pivot_orders(pd.concat(weeks.values(), ignore_index=True))
+    page = pivot.page()
+    assert page[PIVOT_INDEX].values.tolist() == expected[PIVOT_INDEX].values.tolist()
+    plats = [col for col in expected.columns if col not in PIVOT_INDEX]
+    np.testing.assert_array_equal(page[plats].to_numpy(), expected[plats].to_numpy())
+    assert page["Total commandes"].tolist() == expected[plats].sum(axis=1).tolist()
+
+
+def test_materialized_pivot_compacts_removed_rows(monkeypatch):
+    monkeypatch.setattr(transforms, "COMPACT_MIN", 10)
+    pivot = MaterializedPivot()
+    pivot.refresh({week: (1, lambda week=week: week_lines(week, 10)) for week in (1, 2, 3)})
+    assert len(pivot._rows) == 30
+
+    # Deux semaines archivées : leurs lignes sont oubliées, pas seulement masquées
+    pivot.refresh({3: (1, lambda: week_lines(3, 10))})
+    assert len(pivot._rows) == 10
+    assert pivot.stats() == {"lignes": 10, "plats": 2, "cellules": 20}
+    expected = pivot_orders(week_lines(3, 10))
+    assert pivot.page()[PIVOT_INDEX].values.tolist() == expected[PIVOT_INDEX].values.tolist()
+
+    # Une ligne réapparue après la compaction retrouve sa place
+    pivot.refresh({3: (1, lambda: week_lines(3, 10)), 1: (1, lambda: week_lines(1, 1))})
+    assert pivot.stats() == {"lignes": 11, "plats": 4, "cellules": 22}
+    assert pivot.page(size=1)[PIVOT_INDEX].values.tolist() == pivot_orders(week_lines(1, 1))[PIVOT_INDEX].values.tolist()
+
+
+def test_fold_editor_state_maps_window_positions_to_labels():
+    base = pd.DataFrame({"Nom": list("abcde"), "quantity": [1, 2, 3, 4, 5]})
+    window = pd.Index([3, 1])   # page triée : positions 0 et 1 de l'éditeur
+    overlay = fold_editor_state(empty_overlay(), base.index, window, {
+        "edited_rows": {0: {"quantity": 40}}, "deleted_rows": [1], "added_rows": [{"Nom": "f", "quantity": 6}, {}]})
+    assert overlay == {"edited": {3: {"quantity": 40}}, "deleted": {1}, "added": {5: {"Nom": "f", "quantity": 6}}}
+
+    # Ligne ajoutée affichée sur une autre page : modifiée puis supprimée sans toucher au tableau de base
+    overlay = fold_editor_state(overlay, base.index, pd.Index([5]), {"edited_rows": {0: {"quantity": 7}}})
+    assert overlay["added"][5]["quantity"] == 7
+    overlay = fold_editor_state(overlay, base.index, pd.Index([5]), {"deleted_rows": [0]})
+    assert overlay["added"] == {} and overlay["deleted"] == {1}
+
+
+def test_apply_overlay_leaves_the_shared_frame_untouched():
+    base = pd.DataFrame({"Nom": list("abc"), "quantity": [1, 2, 3]})
+    shared = base.copy()
+    overlay = {"edited": {0: {"quantity": 10, "Nom": "z"}}, "deleted": {2}, "added": {3: {"Nom": "d", "quantity": 4}}}
+    result = apply_overlay(shared, overlay)
+    assert result.values.tolist() == [["z", 10], ["b", 2], ["d", 4]]
+    pd.testing.assert_frame_equal(shared, base)
+
+
+def test_extract_delivery_dates_rolls_over_the_year():
+    titres = pd.Series(["Vendredi 02/01: Potée", "Lundi 29/12: Gratin", "Jeudi 17/07: Mijoté", "Sans date"])
+    dates = extract_delivery_dates(titres, reference="2025-12-20")
+    # Début janvier vu fin décembre : l'année suivante ; le jour de la semaine départage
+    assert dates.dt.strftime("%Y-%m-%d").tolist()[:3] == ["2026-01-02", "2025-12-29", "2025-07-17"]
+    assert pd.isna(dates.iloc[3])
+    assert extract_delivery_dates(titres, year=2024).dt.year.tolist()[:3] == [2024, 2024, 2024]
+
+
+def catalogue():
+    return pd.DataFrame({
+        "id": [9002, 9001, 9003, 9001],
+        "title": ["Jeudi 17/07: Mijoté de boeuf", "Noël : Entrée: Duo de foie gras", "Jeudi 17/07: Dessert: Tarte",
+                  "Noël : Entrée: Duo de foie gras"],
+        "price": ["12.5", "18", "x", "18"],
+    })
+
+
+def test_product_dim_keys_products_by_id_and_types_from_title_only():
+    dim = build_product_dim(catalogue(), reference="2025-07-01")
+    assert dim["product_key"].tolist() == [9003, 9002, 9001]
+    assert dim["type"].tolist() == ["Dessert", None, "Entrée"]
+    assert dim["plat"].tolist() == ["Tarte", "Mijoté de boeuf", "Duo de foie gras"]
+    assert dim["jour"].tolist() == ["Jeudi", "Jeudi", "Noël"]
+    assert dim["price"].isna().tolist() == [True, False, False]
+
+
+def test_product_positions_join_on_product_id_then_title():
+    dim = build_product_dim(catalogue(), reference="2025-07-01")
+    plats = pd.Series(["Titre renommé depuis", "Jeudi 17/07: Mijoté de boeuf", "Inconnu", "Jeudi 17/07: Dessert: Tarte"])
+    ids = pd.Series([9001, None, 1234, None])
+    positions = product_positions(plats, dim, ids)
+    assert take_from_dim(positions, dim, "product_key").tolist()[:2] == [9001, 9002]
+    assert positions.tolist()[2:] == [-1, 0]
+    assert product_positions(plats, dim).tolist() == [-1, 1, -1, 0]
+
+
+def edit_pivot():
+    return pd.DataFrame({
+        "order_number": [1, 900001],
+        "Nom": ["Anne", "Bob"],
+        "source_name": ["web", "web"],
+        "note": ["", ""],
+        "Lundi 05/01: A": [2, 3],
+        "Lundi 05/01: B": [0, 1],
+    })
+
+
+def edit_changes(editor_state):
+    plats = ["Lundi 05/01: A", "Lundi 05/01: B"]
+    changes = pivot_edit_changes(edit_pivot(), editor_state, plats, lambda n: list(range(950001, 950001 + n)))
+    return changes[PIVOT_INDEX + ["Plat", "quantity"]].values.tolist()
+
+
+def test_pivot_edit_changes_writes_only_edited_cells():
+    assert edit_changes({}) == []
+    assert edit_changes({"edited_rows": {"0": {"Lundi 05/01: B": 4}}}) == [[1, "Anne", "web", "", "Lundi 05/01: B", 4]]
+    # Cellule vidée = suppression de la ligne
+    assert edit_changes({"edited_rows": {1: {"Lundi 05/01: A": None}}}) == [[900001, "Bob", "web", "", "Lundi 05/01: A", 0]]
+
+
+def test_pivot_edit_changes_moves_lines_on_key_change():
+    changes = pivot_edit_changes(edit_pivot(), {"edited_rows": {"1": {"Nom": "Bea", "note": "sonner"}}},
+                                 ["Lundi 05/01: A", "Lundi 05/01: B"], None)
+    assert changes[PIVOT_INDEX + ["Plat", "quantity"]].values.tolist() == [
+        [900001, "Bob", "web", "", "Lundi 05/01: A", 0], [900001, "Bob", "web", "", "Lundi 05/01: B", 0],
+        [900001, "Bea", "web", "sonner", "Lundi 05/01: A", 3], [900001, "Bea", "web", "sonner", "Lundi 05/01: B", 1]]
+    # Ancienne et nouvelle clé reliées pour le routage vers le même fichier
+    assert changes["move_id"].tolist() == [1, 1, 1, 1]
+
+
+def test_pivot_edit_changes_adds_and_deletes_rows():
+    state = {"added_rows": [{"Nom": "Zoé", "source_name": "non web", "Lundi 05/01: B": 2}, {}], "deleted_rows": [0]}
+    assert edit_changes(state) == [[1, "Anne", "web", "", "Lundi 05/01: A", 0],
+                                   [950001, "Zoé", "non web", "", "Lundi 05/01: B", 2]]
@@ -0,0 +1,554 @@
+# Transformations des commandes (sans Streamlit : utilisables depuis bench.py)
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DATE_PATTERN = r"(\d{2}/\d{2})"
+WEEKDAY_PATTERN = r"^\s*(Lundi|Mardi|Mercredi|Jeudi|Vendredi|Samedi|Dimanche)\b"
+JOURS_SEMAINE = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+
+ROLLOVER_PAST_DAYS = 275    # une date "jj/mm" est cherchée dans [référence - 275 j, référence + 90 j]
+ROLLOVER_FUTURE_DAYS = 90
+
+_date_memo = {}   # (titre, année ou date de référence) -> date de livraison (ou NaT), partagé par le processus
+_date_memo_lock = threading.Lock()
+
+
+# === Date de livraison depuis le titre du plat ("Jeudi 17/07: ...") ===
+def _parse_day_month(day_month, year):
+    return pd.to_datetime(day_month + f"/{year}", format="%d/%m/%Y", errors="coerce")
+
+
+def extract_delivery_dates(plats, year=None, reference=None):
+    # Année fixe si `year` est donné, sinon l'année la plus plausible autour de `reference` (aujourd'hui) :
+    # celle dont le jour correspond au titre ("Jeudi 17/07" -> un jeudi), à défaut la plus proche
+    # ("Jeudi 02/01" vu fin décembre tombe l'année suivante)
+    reference = pd.Timestamp(reference or datetime.today()).normalize()
+    memo_key = year or reference
+    categories = pd.Categorical(plats.astype("string"))
+    titles = categories.categories
+
+    with _date_memo_lock:
+        missing = [t for t in titles if (t, memo_key) not in _date_memo]
+    if missing:
+        # Une seule analyse par titre distinct, entièrement vectorisée
+        missing_titles = pd.Series(missing, dtype="string")
+        day_month = missing_titles.str.extract(DATE_PATTERN, expand=False)
+        if year:
+            parsed = _parse_day_month(day_month, year)
+        else:
+            current, following, previous = (_parse_day_month(day_month, reference.year + k) for k in (0, 1, -1))
+            too_old = current < reference - pd.Timedelta(days=ROLLOVER_PAST_DAYS)
+            too_far = current > reference + pd.Timedelta(days=ROLLOVER_FUTURE_DAYS)
+            parsed = current.mask(too_old, following).mask(too_far, previous)
+
+            weekday = missing_titles.str.extract(WEEKDAY_PATTERN, expand=False).map(
+                {jour: i for i, jour in enumerate(JOURS_SEMAINE)}).astype("Float64")
+            matched = pd.Series(False, index=parsed.index)
+            for candidate in (current, following, previous):
+                ok = (candidate.dt.weekday == weekday).fillna(False).astype(bool) & ~matched
+                parsed = parsed.mask(ok, candidate)
+                matched |= ok
+        with _date_memo_lock:
+            _date_memo.update(zip(((t, memo_key) for t in missing), parsed))
+
+    with _date_memo_lock:
+        by_title = pd.DatetimeIndex([_date_memo[(t, memo_key)] for t in titles]).as_unit("ns").to_numpy()
+    codes = categories.codes
+    values = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[ns]")
+    found = codes >= 0
+    values[found] = by_title[codes[found]]
+    return pd.Series(values, index=plats.index, name="date_livraison")
+
+
+# === Table de dimension produits (construite à chaque rafraîchissement du catalogue) ===
+COURSE_LABELS = {"entrée": "Entrée", "plat chaud": "Plat", "plat": "Plat", "dessert": "Dessert", "potage": "Potage"}
+PRODUCT_DIM_COLUMNS = ["product_key", "id", "title", "date_livraison", "jour", "plat", "type", "price"]
+
+
+def _split_title(title):
+    # "Jeudi 17/07: Mijoté..." -> ("Jeudi 17/07", None, "Mijoté...")
+    # "Noël : Entrée: Duo de foie gras..." -> ("Noël", "Entrée", "Duo de foie gras...")
+    prefix, _, rest = str(title).partition(":")
+    if not rest:
+        return "", None, prefix.strip()
+    label, sep, dish = rest.partition(":")
+    course = COURSE_LABELS.get(label.strip().lower()) if sep else None
+    return prefix.strip(), course, (dish if course else rest).strip()
+
+
+def build_product_dim(products_df, reference=None):
+    products = products_df.drop_duplicates("title").sort_values("title", kind="stable").reset_index(drop=True)
+    titles = products["title"].astype("string")
+    prices = pd.to_numeric(products["price"], errors="coerce")
+    dates = extract_delivery_dates(titles, reference=reference)
+
+    parts = [_split_title(t) for t in titles]
+    jours = [
+        JOURS_SEMAINE[d.weekday()] if pd.notna(d) else prefix
+        for d, (prefix, _, _) in zip(dates, parts)
+    ]
+    return pd.DataFrame({
+        # Identifiant produit Shopify : stable d'un rafraîchissement du catalogue à l'autre
+        "product_key": pd.to_numeric(products["id"], errors="coerce").astype("Int64"),
+        "id": products["id"],
+        "title": titles,
+        "date_livraison": dates.values,
+        "jour": jours,
+        "plat": [dish for _, _, dish in parts],
+        # Type seulement s'il est écrit dans le titre ("Noël : Entrée: ..."), sinon inconnu
+        "type": pd.Series([course for _, course, _ in parts], dtype="object"),
+        "price": prices.astype("float64"),
+    }, columns=PRODUCT_DIM_COLUMNS)
+
+
+def product_positions(plats, dim, product_ids=None):
+    # Ligne du catalogue pour chaque ligne de commande (-1 si absente) : jointure sur entiers par l'identifiant
+    # produit Shopify (product_key) ; le titre ne sert qu'aux lignes sans identifiant connu du catalogue.
+    # Position dans cette table `dim` seulement, à ne pas garder d'un rafraîchissement à l'autre
+    positions = np.full(len(plats), -1, dtype="int32")
+    if product_ids is not None and "product_key" in dim.columns:
+        keys = pd.to_numeric(dim["product_key"], errors="coerce").fillna(-1).to_numpy("int64")
+        rows = np.flatnonzero((keys >= 0) & ~pd.Series(keys).duplicated().to_numpy())
+        ids = pd.to_numeric(pd.Series(product_ids), errors="coerce").fillna(-1).to_numpy("int64")
+        found = pd.Index(keys[rows]).get_indexer(ids)
+        positions = np.where(found >= 0, rows[np.clip(found, 0, None)], -1).astype("int32")
+    by_title = positions < 0
+    if by_title.any():
+        positions[by_title] = pd.Index(dim["title"]).get_indexer(plats[by_title].astype("string"))
+    return pd.Series(positions, index=plats.index)
+
+
+def take_from_dim(positions, dim, column):
+    if dim.empty:
+        return pd.Series(np.nan, index=positions.index)
+    values = dim[column].to_numpy()
+    taken = pd.Series(values[positions.clip(lower=0)], index=positions.index)
+    return taken.where(positions >= 0)
+
+
+# === Codes entiers pour les plats et les clients ===
+class Interner:
+    # Attribue des codes int32 stables aux chaînes ; les chaînes restent dans une table de correspondance.
+    # Limite : la table ne fait que grandir pendant la vie du processus (un code ne peut pas être libéré tant
+    # que le pivot, les agrégats ou les tables d'enrichissement le gardent). Elle suit le nombre de titres et de
+    # noms distincts vus depuis le démarrage (quelques milliers par an), remise à zéro au redémarrage.
+    def __init__(self):
+        self._values = []
+        self._index = pd.Index([], dtype="object")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def encode(self, series):
+        # Un seul hachage par ligne (factorize), puis correspondance des valeurs distinctes seulement
+        local_codes, uniques = pd.factorize(series)
+        uniques = pd.Index(uniques, dtype="object")
+        with self._lock:
+            global_codes = self._index.get_indexer(uniques)
+            if (global_codes < 0).any():
+                self._values.extend(uniques[global_codes < 0])
+                self._index = pd.Index(self._values, dtype="object")
+                global_codes = self._index.get_indexer(uniques)
+        # -1 pour les valeurs manquantes
+        mapping = np.append(global_codes, -1).astype("int32")
+        return pd.Series(mapping[local_codes], index=series.index)
+
+    def decode(self, codes):
+        with self._lock:
+            values = np.asarray(self._values + [np.nan], dtype="object")
+        codes = np.asarray(codes, dtype="int64")
+        return values[np.where(codes >= 0, codes, len(values) - 1)]
+
+
+DISHES = Interner()
+CUSTOMERS = Interner()
+
+
+def intern_orders(df):
+    # Ajoute plat_code / client_code (int32) aux lignes de commande (une seule fois, à l'ingestion)
+    if "plat_code" in df.columns and "client_code" in df.columns:
+        return df
+    df = df.copy()
+    df["plat_code"] = DISHES.encode(df["Plat"]) if "Plat" in df.columns else np.int32(-1)
+    df["client_code"] = CUSTOMERS.encode(df["Nom"]) if "Nom" in df.columns else np.int32(-1)
+    return df
+
+
+PIVOT_INDEX = ["order_number", "Nom", "source_name", "note"]
+PIVOT_KEYS = ["order_number", "client_code", "source_name", "note"]
+
+
+def normalize_lines(df):
+    # Mêmes corrections que les onglets Pivot : textes vides au lieu de NaN, quantités numériques
+    df = df.copy()
+    for col in ["note", "source_name"]:
+        df[col] = df[col].fillna("") if col in df.columns else ""
+    df["Plat"] = df["Plat"].astype(str)
+    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0)
+    return df
+
+
+def aggregate_lines(df):
+    # Quantité et nombre de lignes par (commande, client, source, note, plat), sur les codes entiers
+    df = intern_orders(df)
+    df = df[(df["client_code"] >= 0) & (df["plat_code"] >= 0)]
+    grouped = df.groupby(PIVOT_KEYS + ["plat_code"], observed=True)["quantity"]
+    return pd.DataFrame({"quantity": grouped.sum(), "lines": grouped.size()})
+
+
+def _decode_pivot(row_keys, plat_codes, values):
+    titles = DISHES.decode(plat_codes).astype(str)
+    order = np.argsort(titles, kind="stable")
+    wide = row_keys if isinstance(row_keys, pd.DataFrame) else pd.DataFrame(row_keys, columns=PIVOT_KEYS)
+    wide.insert(1, "Nom", CUSTOMERS.decode(wide.pop("client_code").to_numpy()))
+    cells = pd.DataFrame(values[:, order], columns=pd.Index(titles[order], name="Plat"))
+    return pd.concat([wide, cells], axis=1)
+
+
+def pivot_orders(df):
+    # Équivalent de pivot_table(index=PIVOT_INDEX, columns="Plat", values="quantity", aggfunc="sum", fill_value=0)
+    # .reset_index(), mais regroupé sur les codes entiers au lieu des titres ; lignes triées comme pivot_table
+    # (numéro, nom décodé, source, note) et non dans l'ordre des codes clients
+    wide = aggregate_lines(df)["quantity"].unstack("plat_code", fill_value=0)
+    wide = _decode_pivot(wide.index.to_frame(index=False), wide.columns.to_numpy(), wide.to_numpy())
+    return wide.sort_values(PIVOT_INDEX, kind="stable", ignore_index=True)
+
+
+# === Retour du format large (commande x plat) aux lignes de commande ===
+LINE_TEXT_COLUMNS = ["Nom", "Plat", "source_name", "note"]
+
+
+def unpivot_orders(wide, plats=None, keep_zero=False):
+    # Pivot, page de pivot ou fichier importé au format large -> une ligne par (commande, plat).
+    # Colonnes typées : order_number Int64, quantity int64, textes sans NaN.
+    ids = [col for col in PIVOT_INDEX if col in wide.columns]
+    if plats is None:
+        plats = [col for col in wide.columns if col not in PIVOT_INDEX and col != "Total commandes"]
+    # Plats renommés en positions : melt ne répète que des entiers, les titres sont repris après filtrage
+    cells = wide[list(plats)].set_axis(range(len(plats)), axis=1).melt(var_name="plat_pos", value_name="quantity")
+    quantity = pd.to_numeric(cells["quantity"], errors="coerce").fillna(0).round().astype("int64").to_numpy()
+    kept = np.arange(len(cells)) if keep_zero else np.flatnonzero(quantity)
+    lines = wide[ids].iloc[kept % max(len(wide), 1)].reset_index(drop=True).reindex(columns=PIVOT_INDEX)
+    lines["Plat"] = np.asarray(plats, dtype=object)[cells["plat_pos"].to_numpy()[kept]]
+    lines["quantity"] = quantity[kept]
+    lines["order_number"] = pd.to_numeric(lines["order_number"], errors="coerce").round().astype("Int64")
+    for col in LINE_TEXT_COLUMNS:
+        lines[col] = lines[col].fillna("").astype(str)
+    return lines
+
+
+# === Sauvegarde du pivot éditable : seules les cellules modifiées deviennent des lignes ===
+def _index_text(rows):
+    keys = rows[PIVOT_INDEX].copy()
+    keys["order_number"] = pd.to_numeric(keys["order_number"], errors="coerce")
+    for col in PIVOT_INDEX[1:]:
+        keys[col] = keys[col].fillna("").astype(str)
+    return keys
+
+
+def pivot_edit_changes(original, editor_state, plats, new_order_numbers):
+    # Traduit l'état du data_editor (edited_rows / added_rows / deleted_rows) en quantités à écrire.
+    # Quantité 0 = ligne à supprimer. Le travail suit le nombre de cellules modifiées, pas la taille du pivot.
+    changes = []
+    edited = {int(pos): values for pos, values in editor_state.get("edited_rows", {}).items()}
+    if edited:
+        positions = sorted(edited)
+        before = original.iloc[positions].reset_index(drop=True)
+        after = before.copy()
+        for i, pos in enumerate(positions):
+            for col, value in edited[pos].items():
+                after.loc[i, col] = value
+        key_changed = (_index_text(before) != _index_text(after)).any(axis=1).to_numpy()
+        # Mêmes lignes et mêmes plats des deux côtés : les deux formats longs sont alignés
+        old_cells = unpivot_orders(before, plats, keep_zero=True)
+        new_cells = unpivot_orders(after, plats, keep_zero=True)
+        key_changed = np.tile(key_changed, len(plats))
+        row_ids = np.tile(np.asarray(positions), len(plats))
+
+        # Clé inchangée : seulement les cellules dont la quantité diffère
+        changes.append(new_cells[(old_cells["quantity"] != new_cells["quantity"]).to_numpy() & ~key_changed])
+
+        # Client, source, note ou numéro modifié : la ligne est déplacée vers la nouvelle clé.
+        # move_id relie les deux côtés pour que la nouvelle clé reste dans le fichier de l'ancienne (route_lines)
+        moved = key_changed & (old_cells["quantity"] != 0).to_numpy()
+        changes.append(old_cells[moved].assign(quantity=0, move_id=row_ids[moved]))
+        arrived = key_changed & (new_cells["quantity"] != 0).to_numpy()
+        changes.append(new_cells[arrived].assign(move_id=row_ids[arrived]))
+
+    deleted = sorted(int(pos) for pos in editor_state.get("deleted_rows", []))
+    if deleted:
+        changes.append(unpivot_orders(original.iloc[deleted], plats).assign(quantity=0))
+
+    added = [row for row in editor_state.get("added_rows", []) if row]
+    if added:
+        added = pd.DataFrame(added).reindex(columns=original.columns)
+        missing = pd.to_numeric(added["order_number"], errors="coerce").isna().to_numpy()
+        added["order_number"] = added["order_number"].astype(object)
+        if missing.any():
+            added.loc[missing, "order_number"] = new_order_numbers(int(missing.sum()))
+        changes.append(unpivot_orders(added, plats))
+
+    changes = [df for df in changes if not df.empty]
+    if not changes:
+        return pd.DataFrame(columns=PIVOT_INDEX + ["Plat", "quantity"])
+    return pd.concat(changes, ignore_index=True)
+
+
+# === Éditeur paginé : modifications d'une session gardées à part du tableau partagé (overlay) ===
+def empty_overlay():
+    # edited : étiquette -> {colonne: valeur} ; deleted : étiquettes ; added : étiquette -> ligne
+    return {"edited": {}, "deleted": set(), "added": {}}
+
+
+def fold_editor_state(overlay, base_index, window_index, editor_state):
+    # État du data_editor (positions dans la fenêtre affichée) reporté sur les étiquettes ; nouvel overlay
+    edited = {label: dict(values) for label, values in overlay["edited"].items()}
+    deleted = set(overlay["deleted"])
+    added = {label: dict(row) for label, row in overlay["added"].items()}
+    for pos, values in editor_state.get("edited_rows", {}).items():
+        label = window_index[int(pos)]
+        (added[label] if label in added else edited.setdefault(label, {})).update(values)
+    for pos in editor_state.get("deleted_rows", []):
+        label = window_index[int(pos)]
+        if added.pop(label, None) is None:
+            deleted.add(label)
+            edited.pop(label, None)
+    rows = [row for row in editor_state.get("added_rows", []) if row]
+    if rows:
+        # Nouvelles lignes à la suite de l'index existant (qui reste stable d'une fenêtre à l'autre)
+        start = max([int(base_index.max()) if len(base_index) else -1] + list(added)) + 1
+        added.update(zip(range(start, start + len(rows)), rows))
+    return {"edited": edited, "deleted": deleted, "added": added}
+
+
+def apply_overlay(base, overlay):
+    result = base.copy(deep=False)
+    # Colonnes modifiées copiées avant l'écriture : la version partagée reste intacte, copy-on-write ou non
+    for col in {col for values in overlay["edited"].values() for col in values if col in result.columns}:
+        result[col] = result[col].copy()
+    for label, values in overlay["edited"].items():
+        for col, value in values.items():
+            result.loc[label, col] = value
+    if overlay["deleted"]:
+        result = result.drop(index=list(overlay["deleted"]))
+    if overlay["added"]:
+        added = pd.DataFrame(list(overlay["added"].values()), index=list(overlay["added"])).reindex(columns=base.columns)
+        result = pd.concat([result, added]) if len(result) else added
+    return result
+
+
+# === Pivot commande x plat matérialisé (creux), mis à jour par différence ===
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 64), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+# Au-delà de ce nombre de lignes (ou de cellules), compaction dès que plus de la moitié sont vidées
+COMPACT_MIN = 1000
+
+
+class MaterializedPivot:
+    # Cellules stockées en COO (ligne, plat, quantité) : la mémoire suit les cellules non nulles,
+    # pas commandes x plats. Seule la page affichée est densifiée.
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tokens = {}      # source -> jeton de version de la source (partition)
+        self._contrib = {}     # source -> agrégat de la source (quantity, lines)
+        self._rows = []        # clés de ligne (order_number, client_code, source_name, note)
+        self._row_pos = {}
+        self._cols = []        # codes plats
+        self._col_pos = {}
+        self._cell_pos = {}    # (ligne, plat) -> position dans les tableaux COO
+        self._n_cells = 0
+        self._cell_r = np.zeros(0, dtype="int32")
+        self._cell_c = np.zeros(0, dtype="int32")
+        self._cell_v = np.zeros(0)
+        self._cell_n = np.zeros(0, dtype="int64")
+        self._row_lines = np.zeros(0, dtype="int64")
+        self._row_totals = np.zeros(0)
+        self._col_lines = np.zeros(0, dtype="int64")
+        self._col_totals = np.zeros(0)
+        self._order = None     # lignes visibles dans l'ordre d'affichage (recalculé si la structure change)
+        self.version = 0
+        self.last_changed_rows = 0
+
+    def refresh(self, sources):
+        # sources : {identifiant: (jeton, chargeur)} ; seules les sources dont le jeton a changé sont relues
+        with self._lock:
+            changed_rows = 0
+            for source in [s for s in self._tokens if s not in sources]:
+                changed_rows += self._apply(-self._contrib.pop(source))
+                del self._tokens[source]
+            for source, (token, loader) in sources.items():
+                if self._tokens.get(source) == token:
+                    continue
+                new = aggregate_lines(normalize_lines(loader())) if token is not None else None
+                old = self._contrib.get(source)
+                if new is None or new.empty:
+                    delta = -old if old is not None else None
+                    self._contrib.pop(source, None)
+                else:
+                    delta = new.sub(old, fill_value=0) if old is not None else new
+                    self._contrib[source] = new
+                if delta is not None:
+                    changed_rows += self._apply(delta)
+                self._tokens[source] = token
+            self.last_changed_rows = changed_rows
+            return changed_rows
+
+    def _position(self, positions, keys, key):
+        pos = positions.get(key)
+        if pos is None:
+            pos = positions[key] = len(keys)
+            keys.append(key)
+        return pos
+
+    def _apply(self, delta):
+        delta = delta[(delta["quantity"] != 0) | (delta["lines"] != 0)]
+        if delta.empty:
+            return 0
+        n_rows, n_cols = len(self._rows), len(self._cols)
+        r = np.empty(len(delta), dtype="int32")
+        c = np.empty(len(delta), dtype="int32")
+        p = np.empty(len(delta), dtype="int64")
+        for i, key in enumerate(delta.index):
+            r[i] = self._position(self._row_pos, self._rows, key[:-1])
+            c[i] = self._position(self._col_pos, self._cols, key[-1])
+            cell = (int(r[i]), int(c[i]))
+            pos = self._cell_pos.get(cell)
+            p[i] = pos if pos is not None else self._add_cell(cell)
+        self._row_lines = _grow(self._row_lines, len(self._rows))
+        self._row_totals = _grow(self._row_totals, len(self._rows))
+        self._col_lines = _grow(self._col_lines, len(self._cols))
+        self._col_totals = _grow(self._col_totals, len(self._cols))
+
+        quantity = delta["quantity"].to_numpy(dtype="float64")
+        lines = delta["lines"].to_numpy(dtype="int64")
+        rows_before = self._row_lines[r] > 0
+        cols_before = self._col_lines[c] > 0
+        np.add.at(self._cell_v, p, quantity)
+        np.add.at(self._cell_n, p, lines)
+        np.add.at(self._row_totals, r, quantity)
+        np.add.at(self._col_totals, c, quantity)
+        np.add.at(self._row_lines, r, lines)
+        np.add.at(self._col_lines, c, lines)
+        if (len(self._rows) > n_rows or len(self._cols) > n_cols
+                or (rows_before != (self._row_lines[r] > 0)).any() or (cols_before != (self._col_lines[c] > 0)).any()):
+            self._order = None
+        self.version += 1
+        changed = len(np.unique(r))
+        if len(self._rows) > COMPACT_MIN and (self._row_lines[:len(self._rows)] == 0).sum() > len(self._rows) // 2:
+            self._compact_rows()
+        elif self._n_cells > COMPACT_MIN and (self._cell_n[:self._n_cells] == 0).sum() > self._n_cells // 2:
+            self._compact_cells()
+        return changed
+
+    def _add_cell(self, cell):
+        i = self._cell_pos[cell] = self._n_cells
+        self._cell_r = _grow(self._cell_r, i + 1)
+        self._cell_c = _grow(self._cell_c, i + 1)
+        self._cell_v = _grow(self._cell_v, i + 1)
+        self._cell_n = _grow(self._cell_n, i + 1)
+        self._cell_r[i], self._cell_c[i] = cell
+        self._n_cells = i + 1
+        return i
+
+    def _compact_cells(self):
+        # Oublie les cellules vidées (lignes supprimées)
+        keep = np.flatnonzero(self._cell_n[:self._n_cells] > 0)
+        self._cell_r, self._cell_c = self._cell_r[keep], self._cell_c[keep]
+        self._cell_v, self._cell_n = self._cell_v[keep], self._cell_n[keep]
+        self._n_cells = len(keep)
+        self._cell_pos = {(int(r), int(c)): i for i, (r, c) in enumerate(zip(self._cell_r, self._cell_c))}
+
+    def _compact_rows(self):
+        # Oublie les lignes vidées (commandes supprimées, semaines archivées) et renumérote les cellules
+        keep = np.flatnonzero(self._row_lines[:len(self._rows)] > 0)
+        new_pos = np.full(len(self._rows), -1, dtype="int32")
+        new_pos[keep] = np.arange(len(keep), dtype="int32")
+        self._rows = [self._rows[i] for i in keep]
+        self._row_pos = {key: i for i, key in enumerate(self._rows)}
+        self._row_lines, self._row_totals = self._row_lines[keep], self._row_totals[keep]
+        # Une ligne vivante n'a que des cellules vivantes à renuméroter ; celles des lignes vidées sont oubliées
+        live = np.flatnonzero(self._cell_n[:self._n_cells] > 0)
+        self._cell_r = new_pos[self._cell_r[live]]
+        self._cell_c, self._cell_v, self._cell_n = self._cell_c[live], self._cell_v[live], self._cell_n[live]
+        self._n_cells = len(live)
+        self._cell_pos = {(int(r), int(c)): i for i, (r, c) in enumerate(zip(self._cell_r, self._cell_c))}
+        self._order = None
+
+    # --- Lecture ---
+    def _sorted_rows(self):
+        if self._order is None:
+            visible = np.flatnonzero(self._row_lines[:len(self._rows)] > 0)
+            keys = pd.DataFrame([self._rows[i] for i in visible], columns=PIVOT_KEYS)
+            noms = CUSTOMERS.decode(keys["client_code"].to_numpy()).astype(str)
+            order = np.lexsort([keys["note"].to_numpy(dtype=str), keys["source_name"].to_numpy(dtype=str), noms,
+                                keys["order_number"].to_numpy()]) if len(keys) else np.zeros(0, dtype="int64")
+            self._order = visible[order]
+        return self._order
+
+    def _visible_cols(self):
+        cols = np.flatnonzero(self._col_lines[:len(self._cols)] > 0)
+        codes = np.asarray(self._cols, dtype="int32")[cols]
+        titles = DISHES.decode(codes).astype(str)
+        order = np.argsort(titles, kind="stable")
+        return cols[order], titles[order]
+
+    def count(self, plat=None, nom=None):
+        with self._lock:
+            return len(self._filtered_rows(plat, nom))
+
+    def _filtered_rows(self, plat=None, nom=None):
+        rows = self._sorted_rows()
+        n = self._n_cells
+        if plat:
+            cols, titles = self._visible_cols()
+            wanted = cols[np.char.find(np.char.lower(titles), plat.lower()) >= 0]
+            cells = np.isin(self._cell_c[:n], wanted) & (self._cell_n[:n] > 0)
+            rows = rows[np.isin(rows, self._cell_r[:n][cells])]
+        if nom:
+            codes = np.array([self._rows[i][1] for i in rows], dtype="int32")
+            noms = CUSTOMERS.decode(codes).astype(str)
+            rows = rows[np.char.find(np.char.lower(noms), nom.lower()) >= 0]
+        return rows
+
+    def page(self, start=0, size=None, plat=None, nom=None):
+        # Même présentation que pivot_table(...).reset_index() + "Total commandes", pour les lignes de la page
+        with self._lock:
+            rows = self._filtered_rows(plat, nom)
+            page_rows = rows[start:start + size if size else None]
+            cols, titles = self._visible_cols()
+            values = np.zeros((len(page_rows), len(cols)))
+            n = self._n_cells
+            cells = np.flatnonzero(np.isin(self._cell_r[:n], page_rows) & (self._cell_n[:n] > 0))
+            row_at = np.full(len(self._rows), -1, dtype="int64")
+            row_at[page_rows] = np.arange(len(page_rows))
+            col_at = np.full(len(self._cols), -1, dtype="int64")
+            col_at[cols] = np.arange(len(cols))
+            values[row_at[self._cell_r[cells]], col_at[self._cell_c[cells]]] = self._cell_v[cells]
+            keys = pd.DataFrame([self._rows[i] for i in page_rows], columns=PIVOT_KEYS)
+            wide = _decode_pivot(keys, np.asarray(self._cols, dtype="int32")[cols], values)
+            wide["Total commandes"] = self._row_totals[page_rows]
+            return wide
+
+    def dish_totals(self):
+        with self._lock:
+            cols, titles = self._visible_cols()
+            return pd.Series(self._col_totals[cols], index=titles, name="Total")
+
+    def stats(self):
+        with self._lock:
+            return {"lignes": int((self._row_lines[:len(self._rows)] > 0).sum()),
+                    "plats": int((self._col_lines[:len(self._cols)] > 0).sum()),
+                    "cellules": int((self._cell_n[:self._n_cells] > 0).sum())}
+
+
+ORDER_PIVOT = MaterializedPivot()